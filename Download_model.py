@@ -1,10 +1,14 @@
 import gdown
 import os
 
+from registry_paths import active_version
+
 output_path = "model/model.safetensors"
 
-# Skip download if file already exists
-if os.path.exists(output_path) and os.path.getsize(output_path) > 1_000_000:
+# Skip download if the registry serves a version or the file already exists
+if active_version():
+    print(f"Serving model version '{active_version()}' from the registry. Skipping download.")
+elif os.path.exists(output_path) and os.path.getsize(output_path) > 1_000_000:
     print(f"Model already exists at '{output_path}'. Skipping download.")
 else:
     file_id = "1rcN8X8PLUOlm5fGvRzj3lwfnZytdqrsi"
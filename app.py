@@ -10,17 +10,29 @@ st.set_page_config(
 
 # ── Imports ──────────────────────────────────────────────────────────────────
 import torch
-import torch.nn.functional as F
+import html
+import time
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 from io import BytesIO
+from contextlib import nullcontext
 from datetime import datetime
 
 import Download_model  # ensures model weights exist
+from export import ResultWriter, SpilledResult, EXPORT_FORMATS, ROW_GROUP_SIZE
+from explain import iter_integrated_gradients
+from embedding_store import EmbeddingStore
+from compiled import compile_model, ENABLED as COMPILE_ENABLED
+from precision import configure_precision
+from scheduler import InferenceScheduler
+from registry import ModelPool, Deployment
+from sampling import sample_size, length_strata, stratified_sample, estimate_proportions
+from corpus_cache import corpus_key, load_cleaned, save_cleaned, load_tokens, save_tokens
 from utils import (
-    load_model, label_map, label_colors, label_icons,
-    DEVICE, clean_and_lemmatize_text, get_text_stats,
+    load_model, predict_with_embedding, tokenize_batch, label_map, label_colors, label_icons,
+    DEVICE, clean_and_lemmatize_series, iter_clean_texts, get_text_stats,
     get_label_description, get_resources, CRISIS_INFO,
 )
 
@@ -212,12 +224,406 @@ if "history" not in st.session_state:
     st.session_state.history = []
 
 # ── Load Model (cached) ───────────────────────────────────────────────────────
+def load_serving_model(path):
+    tokenizer, model = load_model(path)
+    configure_precision(model)  # before tracing, so graphs capture the chosen precision
+    if COMPILE_ENABLED:
+        compile_model(model)  # traces and warms every shape bucket up front
+    return tokenizer, model
+
+@st.cache_resource(show_spinner=False)
+def get_model_pool():
+    # Follows the model registry: activating a new version swaps it in
+    # without a restart. Model work leases a Deployment for its duration.
+    return ModelPool(load_serving_model)
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler():
+    # One per process: every session's model work goes through its queues.
+    return InferenceScheduler()
+
 @st.cache_resource(show_spinner=False)
-def get_model():
-    return load_model()
+def get_embedding_store(model_version: str):
+    return EmbeddingStore(model_version)
 
 with st.spinner("🧠 Loading AI model… please wait a moment"):
-    tokenizer, model = get_model()
+    get_model_pool()
+
+# ── Analyze: memoized inference & chart ──────────────────────────────────────
+# Keyed on the model version and the raw input text, so reruns triggered after
+# inference (saving to history, widget interaction) reuse the prediction and
+# figure as-is, and a newly activated version never serves stale results.
+by_version = {Deployment: lambda dep: dep.version}
+
+@st.cache_data(show_spinner=False, max_entries=256, hash_funcs=by_version)
+def predict_text(dep: Deployment, text: str):
+    # (probabilities, pooled [CLS] embedding)
+    return get_scheduler().run_interactive(predict_with_embedding, text, dep.tokenizer, dep.model)
+
+@st.cache_data(show_spinner=False, max_entries=256, hash_funcs=by_version)
+def probability_chart(dep: Deployment, text: str):
+    probs, _ = predict_text(dep, text)
+    pred_label = label_map[int(probs.argmax())]
+
+    labels_list = list(label_map.values())
+    probs_list  = [float(probs[i]) * 100 for i in range(len(labels_list))]
+    colors_list = [label_colors[l] for l in labels_list]
+
+    fig = go.Figure(go.Bar(
+        x=probs_list,
+        y=labels_list,
+        orientation='h',
+        marker=dict(
+            color=colors_list,
+            opacity=[1.0 if l == pred_label else 0.38 for l in labels_list],
+            line=dict(width=0),
+        ),
+        text=[f"{p:.1f}%" for p in probs_list],
+        textposition='inside',
+        insidetextanchor='end',
+        textfont=dict(color='#FFFFFF', size=12),
+        hovertemplate="<b>%{y}</b><br>Confidence: %{x:.2f}%<extra></extra>",
+    ))
+    fig.update_layout(
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=0, r=20, t=10, b=10),
+        xaxis=dict(
+            range=[0, 100],
+            showgrid=False, zeroline=False,
+            tickfont=dict(color='#475569'),
+            showticklabels=False,
+        ),
+        yaxis=dict(
+            tickfont=dict(color='#94A3B8', size=13),
+            gridcolor='rgba(255,255,255,0.04)',
+        ),
+        height=300,
+        bargap=0.35,
+        dragmode=False,
+    )
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=256, hash_funcs=by_version)
+def similar_texts(dep: Deployment, text: str, store_token):
+    # store_token changes with every commit to the store, so fragment reruns
+    # reuse the lookup until new rows become visible.
+    store = get_embedding_store(dep.version)
+    scores, rows = store.search(predict_text(dep, text)[1], k=5)
+    hits = []
+    for score, row in zip(scores, rows):
+        snippet = store.text(int(row))
+        hits.append((float(score), label_map[int(store.labels[row])],
+                     snippet[:200] + ("…" if len(snippet) > 200 else "")))
+    return hits
+
+@st.cache_data(show_spinner=False, max_entries=64, hash_funcs=by_version)
+def explain_text(dep: Deployment, text: str):
+    target = int(predict_text(dep, text)[0].argmax())
+    # Sliced and queued behind predictions, so an explanation holds up another
+    # user's Analyze request for at most one latency-sized slice.
+    return get_scheduler().run_sliced(iter_integrated_gradients(text, dep.tokenizer, dep.model, target=target))
+
+def attribution_html(words, scores, color: str) -> str:
+    # Words pushing towards the predicted label are tinted with its colour,
+    # words pushing away in slate blue; opacity follows |attribution|.
+    if np.size(scores) == 0:
+        return '<span style="color:#64748B;">No words left after cleaning — nothing to attribute.</span>'
+    scale = float(np.abs(scores).max()) or 1.0
+    spans = []
+    for word, score in zip(words, scores):
+        alpha = int(min(abs(score) / scale, 1.0) * 200)
+        tint = color if score >= 0 else "#64748B"
+        spans.append(
+            f'<span title="{score:+.4f}" style="background:{tint}{alpha:02x}; '
+            f'border-radius:4px; padding:1px 3px; margin:1px;">{html.escape(word)}</span>'
+        )
+    return " ".join(spans)
+
+# ── Analyze: fragments ───────────────────────────────────────────────────────
+# Typing and clicking inside a fragment only reruns that fragment, not the CSS,
+# sidebar and page routing above.
+@st.fragment
+def analyze_input():
+    user_input = st.text_area(
+        "Your text",
+        height=160,
+        value="I feel restless and anxious all the time. Nothing I do seems to help.",
+        placeholder="Type something like 'I feel completely hopeless and exhausted every day...'",
+        label_visibility="collapsed",
+        key="analyze_input",
+    )
+
+    # ── Live stats ──
+    if user_input.strip():
+        stats_data = get_text_stats(user_input)
+        wc = stats_data["word_count"]
+        sc = stats_data["sentence_count"]
+        hint = stats_data["quality_hint"]
+        pill_cls = "warning-pill" if wc < 8 else "good-pill"
+        st.markdown(f"""
+        <div style="margin-bottom:12px;">
+            <span class="stat-pill">📝 {wc} words</span>
+            <span class="stat-pill">📄 {sc} sentences</span>
+            <span class="{pill_cls}">{hint}</span>
+        </div>
+        """, unsafe_allow_html=True)
+
+    # ── Compact button — no use_container_width, CSS caps the size ──
+    run = st.button("🔍 Analyze Text", use_container_width=False)
+
+    if run:
+        if not user_input.strip():
+            st.warning("⚠️ Please enter some text before analyzing.")
+        else:
+            with st.spinner("Running inference…"), get_model_pool().lease() as dep:
+                predict_text(dep, user_input)
+            st.session_state.analyzed_text = user_input
+
+    if st.session_state.get("analyzed_text"):
+        analyze_result()
+
+@st.fragment
+def analyze_result():
+    # Reads the text from session state rather than taking it as an argument:
+    # a fragment-only rerun replays the arguments of the first call, which
+    # would be a previously analyzed text. One lease per run, so everything
+    # shown comes from the same model version.
+    with get_model_pool().lease() as dep:
+        render_result(dep, st.session_state.analyzed_text)
+
+def render_result(dep: Deployment, user_input: str):
+    probs = predict_text(dep, user_input)[0]
+    pred_id    = int(probs.argmax())
+    pred_label = label_map[pred_id]
+    confidence = float(probs[pred_id]) * 100
+
+    color = label_colors[pred_label]
+    icon  = label_icons.get(pred_label, "")
+    desc  = get_label_description(pred_label)
+    res   = get_resources(pred_label)
+
+    # ── Result Badge ──
+    st.markdown(f"""
+    <div style="margin: 20px 0 10px;">
+        <div style="font-size:0.75rem; color:#64748B; text-transform:uppercase; letter-spacing:1.5px; margin-bottom:10px;">Prediction Result · model {html.escape(dep.version)}</div>
+        <span class="result-badge" style="background:{color}22; color:{color}; border:2px solid {color}55;">
+            {icon} {pred_label}
+            <span style="font-size:1rem; font-weight:500; opacity:0.8; margin-left:4px;">{confidence:.1f}% confidence</span>
+        </span>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # ── Description ──
+    st.markdown(f"""
+    <div class="glass-card" style="margin:12px 0;">
+        <div style="font-size:0.78rem; color:#64748B; text-transform:uppercase; letter-spacing:1px; margin-bottom:6px;">What this means</div>
+        <div style="color:#CBD5E1; font-size:0.92rem; line-height:1.7;">{desc}</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # ── Plotly Chart (memoized per input) ──
+    st.plotly_chart(
+        probability_chart(dep, user_input),
+        use_container_width=True,
+        config={"displayModeBar": False, "staticPlot": True},
+    )
+
+    # ── Token attributions ──
+    if st.toggle("🔬 Explain prediction", help="Highlights the words that drove this prediction (integrated gradients)."):
+        with st.spinner("Computing attributions…"):
+            words, scores, _ = explain_text(dep, user_input)
+        st.markdown(f"""
+        <div class="glass-card" style="margin:12px 0;">
+            <div style="font-size:0.78rem; color:#64748B; text-transform:uppercase; letter-spacing:1px; margin-bottom:6px;">Why {pred_label}? · words after cleaning</div>
+            <div style="color:#E2E8F0; font-size:0.95rem; line-height:2;">{attribution_html(words, scores, color)}</div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    # ── Similar texts from previous batch runs ──
+    store = get_embedding_store(dep.version)
+    store.refresh()
+    if len(store):
+        with st.expander(f"🔎 Similar previously scored texts ({len(store):,} stored)"):
+            for score, lbl, snippet in similar_texts(dep, user_input, store.version_token):
+                st.markdown(f"""
+                <div class="tip-item">
+                    <span style="color:{label_colors[lbl]}; font-weight:600;">{label_icons.get(lbl, "")} {lbl}</span>
+                    <span style="color:#64748B; font-size:0.8rem; margin-left:8px;">{score * 100:.1f}% similar</span><br>
+                    <span style="color:#CBD5E1;">{html.escape(snippet)}</span>
+                </div>
+                """, unsafe_allow_html=True)
+
+    # ── Crisis Box (if applicable) ──
+    if res["is_crisis"]:
+        st.markdown("""
+        <div class="crisis-box">
+            <div class="crisis-title">🆘 You are not alone — Help is available right now</div>
+            <div style="font-size:0.9rem; color:#FCA5A5; margin-bottom:10px;">
+                If you or someone you know is in crisis, please reach out immediately:
+            </div>
+            <div style="font-size:0.88rem; color:#CBD5E1; line-height:2;">
+                📞 <b>Call or text 988</b> — Suicide & Crisis Lifeline (US, 24/7)<br>
+                💬 <b>Text HOME to 741741</b> — Crisis Text Line (24/7)<br>
+                🌍 <a href="https://www.iasp.info/resources/Crisis_Centres/" style="color:#93C5FD;" target="_blank">Find international crisis centres</a>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    st.markdown('<div class="custom-divider"></div>', unsafe_allow_html=True)
+
+    # ── Coping Strategies & Resources ──
+    col_tips, col_res = st.columns([1, 1], gap="large")
+
+    with col_tips:
+        st.markdown("### 🛠️ Coping Strategies")
+        for tip in res.get("tips", []):
+            st.markdown(f'<div class="tip-item">{tip}</div>', unsafe_allow_html=True)
+
+    with col_res:
+        st.markdown("### 🔗 Helpful Resources")
+        for r_item in res.get("resources", []):
+            st.markdown(f"""
+            <a href="{r_item['url']}" target="_blank" style="
+                display:block; padding:10px 16px; margin:6px 0;
+                background:rgba(99,102,241,0.08); border:1px solid rgba(99,102,241,0.2);
+                border-radius:8px; color:#A5B4FC; font-size:0.88rem;
+                text-decoration:none;">
+                ↗ {r_item['name']}
+            </a>
+            """, unsafe_allow_html=True)
+
+    st.markdown('<div class="custom-divider"></div>', unsafe_allow_html=True)
+
+    # ── Save to History ──
+    if st.button("💾 Save to History", use_container_width=False):
+        st.session_state.history.append({
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "text": user_input[:120] + ("…" if len(user_input) > 120 else ""),
+            "prediction": pred_label,
+            "confidence": f"{confidence:.1f}%",
+            "model_version": dep.version,
+        })
+        st.success("✅ Saved to history!")
+
+# ── Batch: result view ───────────────────────────────────────────────────────
+def summarize_predictions(df: pd.DataFrame) -> pd.DataFrame:
+    labels = list(label_map.values())
+    preds = pd.Categorical(df["prediction"], categories=labels)
+    summary = (
+        df["confidence"]
+        .groupby(preds, observed=False)
+        .agg(count="size", mean_confidence="mean")
+        .rename_axis("prediction")
+        .reset_index()
+    )
+    summary["share"] = summary["count"] / max(len(df), 1) * 100
+    return summary
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def filtered_counts(_result: SpilledResult, results_path: str, labels: tuple, lo: float, hi: float):
+    # Per-row-group match counts, keyed on the (per-run unique) results path.
+    return _result.group_matches(list(labels), lo, hi)
+
+@st.fragment
+def batch_results(batch: dict):
+    result, summary = batch["result"], batch["summary"]
+    st.success(f"✅ Done! Classified {result.rows} rows.")
+
+    # ── Summary (one row per label, independent of the result size) ──
+    col_pie, col_tbl = st.columns([1, 1], gap="large")
+    with col_pie:
+        fig = px.pie(
+            summary[summary["count"] > 0],
+            names="prediction",
+            values="count",
+            color="prediction",
+            color_discrete_map=label_colors,
+            hole=0.45,
+        )
+        fig.update_layout(
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            margin=dict(l=0, r=0, t=10, b=10),
+            legend=dict(font=dict(color='#94A3B8')),
+            height=300,
+        )
+        st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
+    with col_tbl:
+        st.dataframe(
+            summary,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "prediction": "Label",
+                "count": "Rows",
+                "mean_confidence": st.column_config.NumberColumn("Mean confidence", format="%.1f%%"),
+                "share": st.column_config.NumberColumn("Share", format="%.1f%%"),
+            },
+        )
+
+    # ── Filtered, paginated rows ──
+    c1, c2, c3 = st.columns([2, 2, 1])
+    labels = c1.multiselect("Labels", list(label_map.values()), placeholder="All labels")
+    lo, hi = c2.slider("Confidence (%)", 0.0, 100.0, (0.0, 100.0), step=0.5)
+    page_size = c3.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+
+    counts = filtered_counts(result, result.results_path, tuple(labels), lo, hi)
+    n_matches = sum(counts)
+    n_pages = max(1, -(-n_matches // page_size))
+    page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1)
+    start = (page - 1) * page_size
+
+    st.dataframe(
+        result.page(labels, lo, hi, counts, start, page_size),
+        use_container_width=True,
+        column_config={"confidence": st.column_config.NumberColumn(format="%.1f%%")},
+    )
+    st.markdown(f'<span style="color:#64748B; font-size:0.8rem;">Page {page} of {n_pages} · {n_matches} of {result.rows} rows match</span>', unsafe_allow_html=True)
+
+    # Read from the spilled file on each render; no export bytes live in session state.
+    with open(result.export_path, "rb") as f:
+        st.download_button(
+            label=f"⬇️ Download Results {result.ext.upper()}",
+            data=f,
+            file_name=f"predictions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{result.ext}",
+            mime=result.mime,
+        )
+
+# ── Batch: quick estimate ────────────────────────────────────────────────────
+def estimate_view(est: dict, total: int):
+    table = est["table"]
+    fig = go.Figure(go.Bar(
+        x=table["estimate"],
+        y=table["prediction"],
+        orientation='h',
+        marker=dict(color=[label_colors[l] for l in table["prediction"]], line=dict(width=0)),
+        error_x=dict(
+            type='data', symmetric=False,
+            array=table["high"] - table["estimate"],
+            arrayminus=table["estimate"] - table["low"],
+            color='#CBD5E1', thickness=1.5, width=4,
+        ),
+        customdata=table[["low", "high"]].to_numpy(),
+        hovertemplate="<b>%{y}</b><br>%{x:.1f}% (95% CI %{customdata[0]:.1f}–%{customdata[1]:.1f}%)<extra></extra>",
+    ))
+    fig.update_layout(
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=0, r=20, t=10, b=10),
+        xaxis=dict(range=[0, 100], showgrid=False, zeroline=False, tickfont=dict(color='#475569'), ticksuffix="%"),
+        yaxis=dict(tickfont=dict(color='#94A3B8', size=13)),
+        height=300,
+        bargap=0.35,
+        dragmode=False,
+    )
+    st.markdown(f"""
+    <div class="glass-card">
+        <div style="font-size:0.78rem; color:#64748B; text-transform:uppercase; letter-spacing:1px; margin-bottom:6px;">⚡ Quick Estimate</div>
+        <div style="color:#CBD5E1; font-size:0.88rem;">Scored a stratified sample of {len(est['rows'])} of {total} rows · ±{est['margin']}% margin at 95% confidence · {est['seconds']:.1f}s</div>
+    </div>
+    """, unsafe_allow_html=True)
+    st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
 
 # ── Sidebar ───────────────────────────────────────────────────────────────────
 with st.sidebar:
@@ -361,165 +767,7 @@ elif nav == "🔍 Analyze":
     st.markdown("## 🔍 Analyze Text")
     st.markdown('<p style="color:#64748B; margin-top:-10px;">Enter a statement and let the AI classify its mental health indicators.</p>', unsafe_allow_html=True)
 
-    user_input = st.text_area(
-        "Your text",
-        height=160,
-        value="I feel restless and anxious all the time. Nothing I do seems to help.",
-        placeholder="Type something like 'I feel completely hopeless and exhausted every day...'",
-        label_visibility="collapsed",
-    )
-
-    # ── Live stats ──
-    if user_input.strip():
-        stats_data = get_text_stats(user_input)
-        wc = stats_data["word_count"]
-        sc = stats_data["sentence_count"]
-        hint = stats_data["quality_hint"]
-        pill_cls = "warning-pill" if wc < 8 else "good-pill"
-        st.markdown(f"""
-        <div style="margin-bottom:12px;">
-            <span class="stat-pill">📝 {wc} words</span>
-            <span class="stat-pill">📄 {sc} sentences</span>
-            <span class="{pill_cls}">{hint}</span>
-        </div>
-        """, unsafe_allow_html=True)
-
-    # ── Compact button — no use_container_width, CSS caps the size ──
-    run = st.button("🔍 Analyze Text", use_container_width=False)
-
-    if run:
-        if not user_input.strip():
-            st.warning("⚠️ Please enter some text before analyzing.")
-        else:
-            with st.spinner("Running inference…"):
-                cleaned = clean_and_lemmatize_text(user_input)
-                inputs = tokenizer(cleaned, padding="max_length", truncation=True, max_length=128, return_tensors="pt")
-                inputs = {k: v.to(DEVICE) for k, v in inputs.items()}
-                with torch.no_grad():
-                    outputs = model(**inputs)
-                    probs = F.softmax(outputs.logits, dim=1).cpu().numpy()[0]
-                    pred_id = int(probs.argmax())
-                    pred_label = label_map[pred_id]
-                    confidence = float(probs[pred_id]) * 100
-
-            color = label_colors[pred_label]
-            icon  = label_icons.get(pred_label, "")
-            desc  = get_label_description(pred_label)
-            res   = get_resources(pred_label)
-
-            # ── Result Badge ──
-            st.markdown(f"""
-            <div style="margin: 20px 0 10px;">
-                <div style="font-size:0.75rem; color:#64748B; text-transform:uppercase; letter-spacing:1.5px; margin-bottom:10px;">Prediction Result</div>
-                <span class="result-badge" style="background:{color}22; color:{color}; border:2px solid {color}55;">
-                    {icon} {pred_label}
-                    <span style="font-size:1rem; font-weight:500; opacity:0.8; margin-left:4px;">{confidence:.1f}% confidence</span>
-                </span>
-            </div>
-            """, unsafe_allow_html=True)
-
-            # ── Description ──
-            st.markdown(f"""
-            <div class="glass-card" style="margin:12px 0;">
-                <div style="font-size:0.78rem; color:#64748B; text-transform:uppercase; letter-spacing:1px; margin-bottom:6px;">What this means</div>
-                <div style="color:#CBD5E1; font-size:0.92rem; line-height:1.7;">{desc}</div>
-            </div>
-            """, unsafe_allow_html=True)
-
-            # ── Plotly Chart (fixed) ──
-            labels_list = list(label_map.values())
-            probs_list  = [float(probs[i]) * 100 for i in range(len(labels_list))]
-            colors_list = [label_colors[l] for l in labels_list]
-
-            fig = go.Figure(go.Bar(
-                x=probs_list,
-                y=labels_list,
-                orientation='h',
-                marker=dict(
-                    color=colors_list,
-                    opacity=[1.0 if l == pred_label else 0.38 for l in labels_list],
-                    line=dict(width=0),
-                ),
-                text=[f"{p:.1f}%" for p in probs_list],
-                textposition='inside',
-                insidetextanchor='end',
-                textfont=dict(color='#FFFFFF', size=12),
-                hovertemplate="<b>%{y}</b><br>Confidence: %{x:.2f}%<extra></extra>",
-            ))
-            fig.update_layout(
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                margin=dict(l=0, r=20, t=10, b=10),
-                xaxis=dict(
-                    range=[0, 100],
-                    showgrid=False, zeroline=False,
-                    tickfont=dict(color='#475569'),
-                    showticklabels=False,
-                ),
-                yaxis=dict(
-                    tickfont=dict(color='#94A3B8', size=13),
-                    gridcolor='rgba(255,255,255,0.04)',
-                ),
-                height=300,
-                bargap=0.35,
-                dragmode=False,
-            )
-            st.plotly_chart(
-                fig,
-                use_container_width=True,
-                config={"displayModeBar": False, "staticPlot": True},
-            )
-
-            # ── Crisis Box (if applicable) ──
-            if res["is_crisis"]:
-                st.markdown("""
-                <div class="crisis-box">
-                    <div class="crisis-title">🆘 You are not alone — Help is available right now</div>
-                    <div style="font-size:0.9rem; color:#FCA5A5; margin-bottom:10px;">
-                        If you or someone you know is in crisis, please reach out immediately:
-                    </div>
-                    <div style="font-size:0.88rem; color:#CBD5E1; line-height:2;">
-                        📞 <b>Call or text 988</b> — Suicide & Crisis Lifeline (US, 24/7)<br>
-                        💬 <b>Text HOME to 741741</b> — Crisis Text Line (24/7)<br>
-                        🌍 <a href="https://www.iasp.info/resources/Crisis_Centres/" style="color:#93C5FD;" target="_blank">Find international crisis centres</a>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-
-            st.markdown('<div class="custom-divider"></div>', unsafe_allow_html=True)
-
-            # ── Coping Strategies & Resources ──
-            col_tips, col_res = st.columns([1, 1], gap="large")
-
-            with col_tips:
-                st.markdown("### 🛠️ Coping Strategies")
-                for tip in res.get("tips", []):
-                    st.markdown(f'<div class="tip-item">{tip}</div>', unsafe_allow_html=True)
-
-            with col_res:
-                st.markdown("### 🔗 Helpful Resources")
-                for r_item in res.get("resources", []):
-                    st.markdown(f"""
-                    <a href="{r_item['url']}" target="_blank" style="
-                        display:block; padding:10px 16px; margin:6px 0;
-                        background:rgba(99,102,241,0.08); border:1px solid rgba(99,102,241,0.2);
-                        border-radius:8px; color:#A5B4FC; font-size:0.88rem;
-                        text-decoration:none;">
-                        ↗ {r_item['name']}
-                    </a>
-                    """, unsafe_allow_html=True)
-
-            st.markdown('<div class="custom-divider"></div>', unsafe_allow_html=True)
-
-            # ── Save to History ──
-            if st.button("💾 Save to History", use_container_width=False):
-                st.session_state.history.append({
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "text": user_input[:120] + ("…" if len(user_input) > 120 else ""),
-                    "prediction": pred_label,
-                    "confidence": f"{confidence:.1f}%",
-                })
-                st.success("✅ Saved to history!")
+    analyze_input()
 
 
 # ═════════════════════════════════════════════════════════════════════════════
@@ -555,40 +803,177 @@ elif nav == "📋 Batch Predict":
         if text_col is None:
             st.error("❌ No column named 'text' found. Please rename your text column to 'text'.")
         else:
-            if st.button("🚀 Run Batch Prediction", use_container_width=False):
-                predictions, confidences = [], []
-                progress = st.progress(0)
-                status   = st.empty()
-                total    = len(df)
-
-                for i, row_text in enumerate(df[text_col].astype(str)):
-                    cleaned = clean_and_lemmatize_text(row_text)
-                    inputs  = tokenizer(cleaned, padding="max_length", truncation=True, max_length=128, return_tensors="pt")
-                    inputs  = {k: v.to(DEVICE) for k, v in inputs.items()}
-                    with torch.no_grad():
-                        outputs = model(**inputs)
-                        p = F.softmax(outputs.logits, dim=1).cpu().numpy()[0]
-                    pid = int(p.argmax())
-                    predictions.append(label_map[pid])
-                    confidences.append(f"{float(p[pid]) * 100:.1f}%")
-                    progress.progress((i + 1) / total)
-                    status.markdown(f'<span style="color:#94A3B8; font-size:0.82rem;">Processing {i+1}/{total}…</span>', unsafe_allow_html=True)
-
-                df["prediction"]  = predictions
-                df["confidence"]  = confidences
-                progress.empty()
-                status.empty()
-
-                st.success(f"✅ Done! Classified {total} rows.")
-                st.dataframe(df, use_container_width=True)
-
-                csv_bytes = df.to_csv(index=False).encode("utf-8")
-                st.download_button(
-                    label="⬇️ Download Results CSV",
-                    data=csv_bytes,
-                    file_name=f"predictions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv",
-                )
+            export_fmt = st.selectbox(
+                "Export format",
+                list(EXPORT_FORMATS),
+                help="Parquet/Arrow keep all 7 class probabilities as float32 columns.",
+            )
+
+            cache_prep = st.checkbox(
+                "💾 Cache preprocessed text for re-scoring",
+                help="Saves cleaned text and token arrays so later runs on the same file skip straight to the model.",
+            )
+
+            save_embeddings = st.checkbox(
+                "🧭 Save embeddings for similarity search",
+                help="Stores each row's [CLS] embedding so Analyze can show similar previously scored texts.",
+            )
+
+            # ── Quick estimate: score a stratified sample first ──
+            margin = st.select_slider(
+                "Quick estimate margin of error",
+                options=[1, 2, 3, 5, 10],
+                value=5,
+                format_func=lambda m: f"±{m}%",
+                help="Sample size is chosen so every label share is within this margin at 95% confidence.",
+            )
+            est = st.session_state.get("estimate")
+            if est and (est["file_id"] != uploaded_file.file_id or est["version"] != get_model_pool().active.version):
+                est = None
+
+            if st.button("⚡ Quick Estimate", use_container_width=False):
+                if len(df) == 0:
+                    st.warning("⚠️ The uploaded file has no rows to estimate.")
+                else:
+                    with get_model_pool().lease() as dep:
+                        progress = st.progress(0)
+                        status   = st.empty()
+                        t0       = time.perf_counter()
+                        texts    = df[text_col].astype(str)
+                        strata   = length_strata(texts.str.len().to_numpy())
+                        rows     = stratified_sample(strata, sample_size(margin / 100, len(df)))
+                        status.markdown(f'<span style="color:#94A3B8; font-size:0.82rem;">Cleaning sample of {len(rows)}…</span>', unsafe_allow_html=True)
+                        cleaned  = clean_and_lemmatize_series(texts.iloc[rows])
+                        sample_probs, sample_pooled = [], []
+                        with get_scheduler().submit_bulk(dep.model, *tokenize_batch(cleaned, dep.tokenizer)) as job:
+                            for start, p, pooled in job:
+                                sample_probs.append(p)
+                                sample_pooled.append(pooled)
+                                progress.progress(0.5 + (start + len(p)) / len(rows) / 2)
+                                status.markdown(f'<span style="color:#94A3B8; font-size:0.82rem;">Scoring sample {start+len(p)}/{len(rows)}…</span>', unsafe_allow_html=True)
+                        sample_probs = np.concatenate(sample_probs)
+                        share, low, high = estimate_proportions(sample_probs.argmax(axis=1), strata[rows], strata, len(label_map))
+                        progress.empty()
+                        status.empty()
+                        est = st.session_state.estimate = {
+                            "file_id": uploaded_file.file_id,
+                            "version": dep.version,
+                            "margin": margin,
+                            "seconds": time.perf_counter() - t0,
+                            "rows": rows,
+                            "cleaned": cleaned,
+                            "probs": sample_probs,
+                            "pooled": np.concatenate(sample_pooled),
+                            "table": pd.DataFrame({
+                                "prediction": list(label_map.values()),
+                                "estimate": share * 100,
+                                "low": low * 100,
+                                "high": high * 100,
+                            }),
+                        }
+
+            if est:
+                estimate_view(est, len(df))
+
+            run_label = f"🚀 Continue Full Run (reusing {len(est['rows'])} sampled rows)" if est else "🚀 Run Batch Prediction"
+            if st.button(run_label, use_container_width=False):
+                # One lease for the whole file: every row is scored by the same version.
+                with get_model_pool().lease() as dep:
+                    progress = st.progress(0)
+                    status   = st.empty()
+                    total    = len(df)
+                    probs    = np.empty((total, len(label_map)), dtype=np.float32)
+                    st.session_state.pop("batch", None)  # drops (and deletes) the previous run's files
+                    result   = SpilledResult(*EXPORT_FORMATS[export_fmt])
+                    writer   = ResultWriter(export_fmt, dep.version, result.export_path) if export_fmt != "CSV" else None
+                    if est and est["version"] != dep.version:
+                        est = None  # a new version went live after the estimate
+                    sampled  = dict(zip(est["rows"].tolist(), est["cleaned"])) if est else {}
+
+                    # ── Preprocess (reusing cached artifacts where possible) ──
+                    texts  = df[text_col].astype(str).tolist()
+                    key    = corpus_key(texts)
+                    tokens = load_tokens(key, dep.tokenizer)
+                    if tokens is None:
+                        cleaned = load_cleaned(key)
+                        if cleaned is None:
+                            cleaned = [sampled.get(i, "") for i in range(total)]
+                            todo = np.array([i for i in range(total) if i not in sampled], dtype=np.int64)
+                            for start, chunk in iter_clean_texts(df[text_col].astype(str).iloc[todo]):
+                                for i, c in zip(todo[start:start + len(chunk)], chunk):
+                                    cleaned[i] = c
+                                done = total - len(todo) + start + len(chunk)
+                                progress.progress(done / total)
+                                status.markdown(f'<span style="color:#94A3B8; font-size:0.82rem;">Cleaning {done}/{total}…</span>', unsafe_allow_html=True)
+                            if cache_prep:
+                                save_cleaned(key, cleaned)
+                        status.markdown('<span style="color:#94A3B8; font-size:0.82rem;">Tokenizing…</span>', unsafe_allow_html=True)
+                        tokens = tokenize_batch(cleaned, dep.tokenizer)
+                        if cache_prep:
+                            save_tokens(key, dep.tokenizer, *tokens)
+
+                    # ── Batched forward pass (rows from a quick estimate are reused) ──
+                    # The writer holds the store's write lock until the block exits, so an
+                    # interrupted run closes its files and leaves nothing committed.
+                    store = get_embedding_store(dep.version)
+                    save = save_embeddings and key not in store
+                    with (store.writer(key) if save else nullcontext()) as store_writer:
+                        rows = np.arange(total)
+                        if est:
+                            probs[est["rows"]] = est["probs"]
+                            rows = np.setdiff1d(rows, est["rows"])
+                            if store_writer:
+                                store_writer.append(est["pooled"], [texts[r] for r in est["rows"]], est["probs"].argmax(axis=1))
+                        written = 0
+                        with get_scheduler().submit_bulk(dep.model, *tokens, rows=rows) as job:
+                            for start, p, pooled in job:
+                                end = start + len(p)
+                                scored = rows[start:end]
+                                probs[scored] = p
+                                if store_writer:
+                                    store_writer.append(pooled, [texts[r] for r in scored], p.argmax(axis=1))
+                                # every row before the next pending one is final
+                                ready = rows[end] if end < len(rows) else total
+                                while writer and ready - written >= ROW_GROUP_SIZE:
+                                    writer.write(written, probs[written:written + ROW_GROUP_SIZE])
+                                    written += ROW_GROUP_SIZE
+                                done = total - len(rows) + end
+                                progress.progress(done / total)
+                                status.markdown(f'<span style="color:#94A3B8; font-size:0.82rem;">Scoring {done}/{total}…</span>', unsafe_allow_html=True)
+                        while writer and written < total:
+                            writer.write(written, probs[written:written + ROW_GROUP_SIZE])
+                            written += ROW_GROUP_SIZE
+
+                        if store_writer:
+                            store_writer.commit()
+                            if store.needs_index():
+                                status.markdown('<span style="color:#94A3B8; font-size:0.82rem;">Indexing embeddings…</span>', unsafe_allow_html=True)
+                                store.update_index()
+
+                    df["prediction"]  = pd.Categorical.from_codes(probs.argmax(axis=1), categories=list(label_map.values()))
+                    df["confidence"]  = probs.max(axis=1).astype(np.float64) * 100
+                    df["model_version"] = pd.Categorical.from_codes(np.zeros(total, dtype=np.int8), categories=[dep.version])
+                    progress.empty()
+
+                    # Results and the export are spilled to disk once here; session
+                    # state keeps only the 7-row summary and the file locations.
+                    status.markdown('<span style="color:#94A3B8; font-size:0.82rem;">Writing results…</span>', unsafe_allow_html=True)
+                    result.write(df)
+                    if writer:
+                        writer.close()
+                    else:
+                        result.write_csv_export()
+                    status.empty()
+                    st.session_state.pop("estimate", None)
+                    st.session_state.batch = {
+                        "file_id": uploaded_file.file_id,
+                        "result": result,
+                        "summary": summarize_predictions(df),
+                    }
+
+            batch = st.session_state.get("batch")
+            if batch and batch["file_id"] == uploaded_file.file_id:
+                batch_results(batch)
 
 
 # ═════════════════════════════════════════════════════════════════════════════
@@ -656,6 +1041,34 @@ elif nav == "ℹ️ About":
     </div>
     """, unsafe_allow_html=True)
 
+    # ── Runtime diagnostics ──
+    pool = get_model_pool()
+    active = pool.active
+    prec = active.model.precision_info
+    speedup = f" · {prec['speedup']}× vs fp32 (measured)" if prec["speedup"] else ""
+    compiled_fwd = getattr(active.model, "compiled_forward", None)
+    pool_state = pool.status()
+    swaps = [f"loading {pool_state['loading']}"] if pool_state["loading"] else []
+    swaps += [f"draining {v} ({n} in flight)" for v, n in pool_state["draining"]]
+    if pool_state["failed"]:
+        swaps.append(f"failed to load {pool_state['failed'][0]}: {pool_state['failed'][1]}")
+    graphs = f"TorchScript · {len(compiled_fwd.graphs)} warm graphs" if compiled_fwd else "eager"
+    sched = get_scheduler().stats()
+    fmt_ms = lambda v: f"{v:.0f} ms" if v is not None else "–"
+    st.markdown(f"""
+    <div class="glass-card">
+        <h3 style="margin-top:0;">⚙️ Runtime</h3>
+        <div style="color:#CBD5E1; font-size:0.92rem; line-height:2;">
+            <b style="color:#A5B4FC;">Model version:</b> {html.escape(active.version)}{html.escape(" · " + " · ".join(swaps)) if swaps else ""}<br>
+            <b style="color:#A5B4FC;">Device:</b> {DEVICE} · {torch.get_num_threads()} threads<br>
+            <b style="color:#A5B4FC;">Precision:</b> {prec['precision']} (requested {prec['requested']}){speedup}<br>
+            <b style="color:#A5B4FC;">Execution:</b> {graphs}<br>
+            <b style="color:#A5B4FC;">Scheduler:</b> Analyze p50 {fmt_ms(sched['interactive_p50_ms'])} · p95 {fmt_ms(sched['interactive_p95_ms'])} (target {sched['target_ms']:.0f} ms) · explanations p50 {fmt_ms(sched['sliced_p50_ms'])}, slice p95 {fmt_ms(sched['slice_p95_ms'])} · batch uses {sched['threads'][1]}/{sched['threads'][0]} threads · {sched['bulk_jobs']} batch job(s) running
+            {f'<br><span style="color:#64748B; font-size:0.82rem;">{html.escape(prec["note"])}</span>' if prec["note"] else ""}
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
     st.markdown("""
     <div class="glass-card">
         <h3 style="margin-top:0;">🆘 Crisis Resources</h3>
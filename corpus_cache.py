@@ -0,0 +1,104 @@
+import fcntl
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from utils import (
+    project_dir, MAX_LENGTH, get_wordnet_pos, fix_encoding, normalize_text, clean_and_lemmatize_text,
+    normalize_series, clean_and_lemmatize_series,
+    RT_RE, MENTION_RE, URL_RE, HASHTAG_RE, DISALLOWED_RE, SPACE_RE, BULK_PASSES, NON_ASCII,
+)
+
+# ─── Layout ────────────────────────────────────────────────────────────────────
+# cache/corpus/<input hash>/<preprocess version>/
+#     cleaned/blob.npy, cleaned/offsets.npy        ← UTF-8 cleaned text
+#     tokens-<tokenizer fingerprint>/
+#         input_ids.npy, attention_mask.npy        ← (n × MAX_LENGTH)
+# Everything is loaded with mmap_mode="r", so a re-score only pages in what
+# the forward pass reads.
+CACHE_DIR = os.path.join(project_dir, "cache", "corpus")
+
+# Fingerprint of the cleaning code itself: editing it invalidates cleaned text
+# (and the tokens built from it) without a manual version bump. Both the scalar
+# path and the bulk path the batch page actually uses are covered.
+PREPROCESS_VERSION = hashlib.sha256("".join(
+    [inspect.getsource(f) for f in (get_wordnet_pos, fix_encoding, normalize_text, clean_and_lemmatize_text,
+                                    normalize_series, clean_and_lemmatize_series)]
+    + [p.pattern for p in (RT_RE, MENTION_RE, URL_RE, HASHTAG_RE, DISALLOWED_RE, SPACE_RE)]
+    + [pattern + "\0" + repl for pattern, repl in BULK_PASSES] + [NON_ASCII]
+).encode()).hexdigest()[:12]
+
+def corpus_key(texts) -> str:
+    h = hashlib.sha256()
+    for t in texts:
+        b = t.encode("utf-8", errors="surrogatepass")
+        h.update(len(b).to_bytes(8, "little"))
+        h.update(b)
+    return h.hexdigest()[:24]
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    vocab = sorted(tokenizer.get_vocab().items())
+    payload = json.dumps([type(tokenizer).__name__, getattr(tokenizer, "do_lower_case", None), MAX_LENGTH, vocab])
+    return hashlib.sha256(payload.encode()).hexdigest()[:12]
+
+def _version_dir(key):
+    return os.path.join(CACHE_DIR, key, PREPROCESS_VERSION)
+
+def _tokens_dir(key, tokenizer):
+    return os.path.join(_version_dir(key), f"tokens-{tokenizer_fingerprint(tokenizer)}")
+
+def _save_arrays(target, arrays: dict):
+    # Write into a sibling temp dir and rename, so readers never see half an
+    # artifact. Sessions caching the same upload serialise on a per-target
+    # lock; artifacts are keyed by content, so one that is already complete
+    # is simply kept.
+    parent = os.path.dirname(target)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), arr)
+        with open(target + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if _load_arrays(target, arrays) is not None:
+                shutil.rmtree(tmp)
+                return
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            os.replace(tmp, target)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+def _load_arrays(target, names):
+    try:
+        return [np.load(os.path.join(target, f"{name}.npy"), mmap_mode="r") for name in names]
+    except (FileNotFoundError, ValueError):
+        return None
+
+# ─── Cleaned Text ──────────────────────────────────────────────────────────────
+def save_cleaned(key, cleaned):
+    encoded = [c.encode("utf-8") for c in cleaned]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    _save_arrays(os.path.join(_version_dir(key), "cleaned"), {"blob": blob, "offsets": offsets})
+
+def load_cleaned(key):
+    arrays = _load_arrays(os.path.join(_version_dir(key), "cleaned"), ["blob", "offsets"])
+    if arrays is None:
+        return None
+    blob, offsets = arrays
+    return [bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8") for i in range(len(offsets) - 1)]
+
+# ─── Token Arrays ──────────────────────────────────────────────────────────────
+def save_tokens(key, tokenizer, input_ids, attention_mask):
+    _save_arrays(_tokens_dir(key, tokenizer), {"input_ids": input_ids, "attention_mask": attention_mask})
+
+def load_tokens(key, tokenizer):
+    return _load_arrays(_tokens_dir(key, tokenizer), ["input_ids", "attention_mask"])
@@ -0,0 +1,285 @@
+import fcntl
+import json
+import os
+
+import numpy as np
+
+from utils import project_dir
+
+# ─── Layout ────────────────────────────────────────────────────────────────────
+# cache/embeddings/<model version>/   (embeddings are only comparable within a version)
+#     manifest.json        ← committed row count, corpora included, index info
+#     embeddings.f16       ← (rows × dim) L2-normalised float16, append-only
+#     labels.i8            ← predicted label id per row
+#     text_ends.i64        ← end offset of each row's text in texts.bin
+#     texts.bin            ← UTF-8 source texts, concatenated
+#     ivf_*.npy            ← cluster index over the first `index_rows` rows
+#                            (k-means trained when the store had `trained_rows`)
+#     write.lock           ← held by the one writer allowed at a time
+# Only rows counted in the manifest are visible, so an interrupted append is
+# simply truncated away on the next write.
+STORE_DIR = os.path.join(project_dir, "cache", "embeddings")
+IVF_MIN_ROWS = 20_000       # below this, brute force stays in the tens of ms
+IVF_RETRAIN_GROWTH = 1.0    # re-run k-means once the store has doubled since training
+IVF_NPROBE = 8
+SEARCH_CHUNK = 1 << 16
+ASSIGN_BLOCK = 1 << 24      # max elements of one (rows × centroids) score block
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+def _assign(vectors, centroids):
+    # Nearest centroid per row, scored in blocks so the score matrix stays
+    # under ASSIGN_BLOCK elements however many rows and centroids there are.
+    chunk = max(1, ASSIGN_BLOCK // len(centroids))
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for s in range(0, len(vectors), chunk):
+        e = min(s + chunk, len(vectors))
+        assign[s:e] = (np.asarray(vectors[s:e], dtype=np.float32) @ centroids.T).argmax(axis=1)
+    return assign
+
+def _top_k(scores, ids, k):
+    if len(scores) > k:
+        part = np.argpartition(-scores, k)[:k]
+        scores, ids = scores[part], ids[part]
+    order = np.argsort(-scores)
+    return scores[order], ids[order]
+
+class EmbeddingStore:
+    def __init__(self, model_version):
+        self.path = os.path.join(STORE_DIR, model_version)
+        self._mtime = None
+        self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    # ── Reading ──
+    def _load(self):
+        try:
+            self._mtime = os.stat(self._file("manifest.json")).st_mtime_ns
+            with open(self._file("manifest.json")) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self._mtime = None
+            self.manifest = {"rows": 0, "dim": None, "corpora": [], "index_rows": 0, "trained_rows": 0}
+        rows, dim = self.manifest["rows"], self.manifest["dim"]
+        if rows:
+            self.embeddings = np.memmap(self._file("embeddings.f16"), dtype=np.float16, mode="r", shape=(rows, dim))
+            self.labels = np.memmap(self._file("labels.i8"), dtype=np.int8, mode="r", shape=(rows,))
+            self.text_ends = np.memmap(self._file("text_ends.i64"), dtype=np.int64, mode="r", shape=(rows,))
+        self.ivf = None
+        if self.manifest["index_rows"]:
+            self.ivf = {name: np.load(self._file(f"ivf_{name}.npy"), mmap_mode="r")
+                        for name in ("centroids", "order", "offsets")}
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self._file("manifest.json")).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self._load()
+
+    @property
+    def version_token(self):
+        # Changes whenever a commit or index update becomes visible.
+        return self._mtime
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def __contains__(self, corpus_key):
+        return corpus_key in self.manifest["corpora"]
+
+    def text(self, row):
+        start = int(self.text_ends[row - 1]) if row else 0
+        with open(self._file("texts.bin"), "rb") as f:
+            f.seek(start)
+            return f.read(int(self.text_ends[row]) - start).decode("utf-8")
+
+    # ── Search ──
+    def search(self, query, k=5, nprobe=IVF_NPROBE):
+        # Returns (scores, row ids) of the k most cosine-similar stored rows.
+        rows = len(self)
+        if not rows:
+            return np.empty(0, np.float32), np.empty(0, np.int64)
+        q = _normalize(query)
+        scores, ids = [], []
+        start = 0
+        if self.ivf is not None:
+            centroid_scores = self.ivf["centroids"] @ q
+            probe = np.argpartition(-centroid_scores, min(nprobe, len(centroid_scores) - 1))[:nprobe]
+            offsets, order = self.ivf["offsets"], self.ivf["order"]
+            cand = np.sort(np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe]))
+            cand = cand[cand < self.manifest["index_rows"]]  # index files may be newer than our manifest
+            scores.append(self.embeddings[cand].astype(np.float32) @ q)
+            ids.append(cand)
+            start = self.manifest["index_rows"]
+        # Brute force over everything not covered by the cluster index
+        for s in range(start, rows, SEARCH_CHUNK):
+            e = min(s + SEARCH_CHUNK, rows)
+            chunk_scores = self.embeddings[s:e].astype(np.float32) @ q
+            chunk_scores, chunk_ids = _top_k(chunk_scores, np.arange(s, e), k)
+            scores.append(chunk_scores)
+            ids.append(chunk_ids)
+        return _top_k(np.concatenate(scores), np.concatenate(ids), k)
+
+    # ── Writing ──
+    def writer(self, corpus_key):
+        # Blocks until no other session or process is writing to this store.
+        # Use as a context manager; update_index() belongs inside the block too.
+        return StoreWriter(self, corpus_key)
+
+    def build_index(self, n_iter=10, seed=0):
+        # Spherical k-means on a sample, then every row is assigned to its
+        # nearest centroid and rows are grouped by cluster (order/offsets).
+        rows = len(self)
+        if rows < IVF_MIN_ROWS:
+            return
+        rng = np.random.default_rng(seed)
+        nlist = int(min(4096, 2 * np.sqrt(rows)))
+        sample = _normalize(self.embeddings[np.sort(rng.choice(rows, min(rows, nlist * 32), replace=False))])
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(n_iter):
+            assign = _assign(sample, centroids)
+            by_cluster = np.argsort(assign, kind="stable")
+            starts = np.searchsorted(assign[by_cluster], np.arange(nlist))
+            present = np.bincount(assign, minlength=nlist) > 0
+            sums = centroids.copy()
+            sums[present] = np.add.reduceat(sample[by_cluster], starts[present], axis=0)
+            centroids = _normalize(sums)
+
+        assign = _assign(self.embeddings, centroids)
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.searchsorted(assign[order], np.arange(nlist + 1)).astype(np.int64)
+        self._save_index(centroids, order, offsets, trained_rows=rows)
+
+    def extend_index(self):
+        # Assigns rows appended since the last update to the existing
+        # centroids and merges them into the inverted lists, so the
+        # brute-forced tail stays empty without re-running k-means.
+        rows, indexed = len(self), self.manifest["index_rows"]
+        if not indexed or rows <= indexed:
+            return
+        centroids = np.asarray(self.ivf["centroids"])
+        offsets = np.asarray(self.ivf["offsets"])
+        nlist = len(centroids)
+        new_assign = _assign(self.embeddings[indexed:rows], centroids)
+        clusters = np.concatenate([np.repeat(np.arange(nlist, dtype=np.int32), np.diff(offsets)), new_assign])
+        ids = np.concatenate([np.asarray(self.ivf["order"]), np.arange(indexed, rows, dtype=np.int64)])
+        by_cluster = np.argsort(clusters, kind="stable")  # existing rows stay ahead of new ones
+        order = ids[by_cluster]
+        offsets = np.searchsorted(clusters[by_cluster], np.arange(nlist + 1)).astype(np.int64)
+        self._save_index(centroids, order, offsets, trained_rows=self.manifest.get("trained_rows", indexed))
+
+    def update_index(self):
+        # Full k-means for a new or outgrown index, otherwise an incremental
+        # extension. Call while holding the store's writer.
+        if not self.needs_index():
+            return
+        trained = self.manifest.get("trained_rows", self.manifest["index_rows"])
+        if not trained or len(self) >= (1 + IVF_RETRAIN_GROWTH) * trained:
+            self.build_index()
+        else:
+            self.extend_index()
+
+    def _save_index(self, centroids, order, offsets, trained_rows):
+        # Replace rather than overwrite: other sessions may have these mapped.
+        for name, arr in (("centroids", centroids), ("order", order), ("offsets", offsets)):
+            tmp = self._file(f"ivf_{name}.tmp.npy")
+            np.save(tmp, arr)
+            os.replace(tmp, self._file(f"ivf_{name}.npy"))
+        self._write_manifest(dict(self.manifest, index_rows=len(order), trained_rows=trained_rows))
+
+    def needs_index(self):
+        rows, indexed = len(self), self.manifest["index_rows"]
+        return rows >= IVF_MIN_ROWS and rows > indexed
+
+    def _write_manifest(self, manifest):
+        tmp = self._file("manifest.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._file("manifest.json"))
+        self._load()
+
+class StoreWriter:
+    # Appends batches to the store files; nothing becomes visible to readers
+    # until commit() rewrites the manifest. An exclusive lock on write.lock is
+    # held from construction until close(), so appends from concurrent
+    # sessions or worker processes never interleave.
+    def __init__(self, store, corpus_key):
+        self.store = store
+        self.corpus_key = corpus_key
+        os.makedirs(store.path, exist_ok=True)
+        self._lock = open(store._file("write.lock"), "a")
+        fcntl.flock(self._lock, fcntl.LOCK_EX)
+        self._files = {}
+        try:
+            store.refresh()
+            # Another writer may have stored the same corpus while we waited.
+            self.skip = corpus_key in store
+            self.rows, self.dim = len(store), store.manifest["dim"]
+            self.text_end = int(store.text_ends[-1]) if self.rows else 0
+            committed = {
+                "embeddings.f16": self.rows * (self.dim or 0) * 2,
+                "labels.i8":      self.rows,
+                "text_ends.i64":  self.rows * 8,
+                "texts.bin":      self.text_end,
+            }
+            if not self.skip:
+                for name, size in committed.items():
+                    f = open(store._file(name), "ab")
+                    self._files[name] = f
+                    f.truncate(size)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, embeddings, texts, labels):
+        if self.skip:
+            return
+        embeddings = _normalize(embeddings)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding size {embeddings.shape[1]} does not match store ({self.dim})")
+        encoded = [t.encode("utf-8") for t in texts]
+        ends = self.text_end + np.cumsum([len(b) for b in encoded], dtype=np.int64)
+        self._files["embeddings.f16"].write(embeddings.astype(np.float16).tobytes())
+        self._files["labels.i8"].write(np.asarray(labels, dtype=np.int8).tobytes())
+        self._files["text_ends.i64"].write(ends.tobytes())
+        self._files["texts.bin"].write(b"".join(encoded))
+        self.rows += len(encoded)
+        if len(ends):
+            self.text_end = int(ends[-1])
+
+    def commit(self):
+        if self.skip:
+            return
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        manifest = self.store.manifest
+        self.store._write_manifest(dict(
+            manifest,
+            rows=self.rows,
+            dim=self.dim,
+            corpora=manifest["corpora"] + [self.corpus_key],
+        ))
+
+    def close(self):
+        # Uncommitted appends stay invisible and are truncated by the next writer.
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        if not self._lock.closed:
+            fcntl.flock(self._lock, fcntl.LOCK_UN)
+            self._lock.close()
@@ -0,0 +1,69 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from utils import DEVICE, MAX_LENGTH, clean_and_lemmatize_text
+
+# ─── Integrated Gradients ──────────────────────────────────────────────────────
+# Attributions are taken w.r.t. the word embeddings, integrating the target
+# class probability along a straight path from a [PAD] baseline ([CLS]/[SEP]
+# kept in place). Interpolation steps are stacked into the batch dimension.
+# The generator is driven by the scheduler: after setup it yields 0, then each
+# send(n) runs the next n steps as one forward/backward pass and yields how
+# many ran, so an explanation is cut into slices sized to the latency target.
+# The attributions are the generator's return value.
+IG_STEPS = 32
+
+def iter_integrated_gradients(text, tokenizer, model, target=None, steps=IG_STEPS):
+    cleaned = clean_and_lemmatize_text(text)
+    enc = tokenizer(cleaned, truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
+    input_ids = enc["input_ids"].to(DEVICE)
+    attention_mask = enc["attention_mask"].to(DEVICE)
+    embeddings = model.get_input_embeddings()
+
+    special = torch.tensor(
+        tokenizer.get_special_tokens_mask(input_ids[0].tolist(), already_has_special_tokens=True),
+        dtype=torch.bool, device=DEVICE,
+    )
+    baseline_ids = torch.where(special, input_ids[0], tokenizer.pad_token_id).unsqueeze(0)
+
+    with torch.no_grad():
+        x = embeddings(input_ids)
+        x0 = embeddings(baseline_ids)
+        if target is None:
+            target = int(model(input_ids=input_ids, attention_mask=attention_mask).logits.argmax())
+
+    # Midpoint Riemann sum over alpha ∈ (0, 1)
+    alphas = (torch.arange(steps, dtype=x.dtype, device=DEVICE) + 0.5) / steps
+    total_grad = torch.zeros_like(x)
+    n = yield 0
+    start = 0
+    while start < steps:
+        a = alphas[start:start + n].view(-1, 1, 1)
+        path = (x0 + a * (x - x0)).detach().requires_grad_(True)
+        with torch.enable_grad():
+            logits = model(inputs_embeds=path, attention_mask=attention_mask.expand(len(a), -1)).logits
+            prob = F.softmax(logits, dim=1)[:, target].sum()
+            (grad,) = torch.autograd.grad(prob, path)
+        total_grad += grad.sum(dim=0, keepdim=True)
+        start += len(a)
+        if start < steps:
+            n = yield len(a)
+
+    scores = ((x - x0) * total_grad / steps).sum(dim=-1)[0].detach().cpu().numpy()
+    tokens = tokenizer.convert_ids_to_tokens(input_ids[0].tolist())
+    words, word_scores = merge_wordpieces(tokens, scores, special.cpu().numpy())
+    return words, word_scores, target
+
+def merge_wordpieces(tokens, scores, special):
+    words, word_scores = [], []
+    for tok, score, is_special in zip(tokens, scores, special):
+        if is_special:
+            continue
+        if tok.startswith("##") and words:
+            words[-1] += tok[2:]
+            word_scores[-1] += float(score)
+        else:
+            words.append(tok)
+            word_scores.append(float(score))
+    return words, np.asarray(word_scores, dtype=np.float32)
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import label_map
+
+# ─── Result Schema ─────────────────────────────────────────────────────────────
+LABELS = list(label_map.values())
+PROB_COLUMNS = ["prob_" + label.lower().replace(" ", "_") for label in LABELS]
+ROW_GROUP_SIZE = 8192
+
+RESULT_SCHEMA = pa.schema(
+    [
+        ("row_id", pa.int64()),
+        ("prediction", pa.dictionary(pa.int8(), pa.string())),
+        ("model_version", pa.dictionary(pa.int8(), pa.string())),
+    ]
+    + [(col, pa.float32()) for col in PROB_COLUMNS]
+)
+
+EXPORT_FORMATS = {
+    # name: (file extension, mime type)
+    "CSV":     ("csv",     "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Arrow":   ("arrow",   "application/vnd.apache.arrow.file"),
+}
+
+# ─── Incremental Writer ────────────────────────────────────────────────────────
+# Each write() takes the softmax output (n × 7) for source rows start..start+n
+# and emits it as one row group / record batch. The label column is encoded
+# against the fixed label order, so every chunk shares one dictionary; the
+# model version is a one-entry dictionary, so it costs next to nothing per row.
+class ResultWriter:
+    def __init__(self, fmt: str, model_version: str, path: str):
+        self.path = path
+        if fmt == "Parquet":
+            self._writer = pq.ParquetWriter(path, RESULT_SCHEMA, compression="zstd")
+        elif fmt == "Arrow":
+            self._writer = pa.ipc.new_file(path, RESULT_SCHEMA)
+        else:
+            raise ValueError(f"Unsupported columnar export format: {fmt}")
+        self._labels = pa.array(LABELS, type=pa.string())
+        self._version = pa.array([model_version], type=pa.string())
+
+    def write(self, start: int, probs: np.ndarray):
+        probs = np.asarray(probs, dtype=np.float32)
+        n = len(probs)
+        columns = [
+            pa.array(np.arange(start, start + n, dtype=np.int64)),
+            pa.DictionaryArray.from_arrays(
+                pa.array(probs.argmax(axis=1).astype(np.int8)), self._labels
+            ),
+            pa.DictionaryArray.from_arrays(pa.array(np.zeros(n, dtype=np.int8)), self._version),
+        ] + [pa.array(probs[:, j]) for j in range(probs.shape[1])]
+        self._writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=RESULT_SCHEMA))
+
+    def close(self):
+        self._writer.close()
+
+# ─── Spilled Results ───────────────────────────────────────────────────────────
+# A finished batch run lives on disk, not in session state: the scored rows go
+# to results.parquet (one row group per ROW_GROUP_SIZE rows) next to the
+# download file. Filtering and paging read one row group at a time, so memory
+# does not grow with the upload. The directory is removed when the object is
+# dropped, i.e. on the next run or when the session ends.
+class SpilledResult:
+    def __init__(self, ext: str, mime: str):
+        self.dir = tempfile.mkdtemp(prefix="mha-batch-")
+        self._cleanup = weakref.finalize(self, shutil.rmtree, self.dir, ignore_errors=True)
+        self.results_path = os.path.join(self.dir, "results.parquet")
+        self.export_path = os.path.join(self.dir, f"export.{ext}")
+        self.ext, self.mime = ext, mime
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame):
+        df = df.astype({c: "string" for c in df.columns if df[c].dtype == object})
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), self.results_path,
+                       row_group_size=ROW_GROUP_SIZE, compression="zstd")
+        self.rows = len(df)
+
+    def write_csv_export(self):
+        # Same CSV as before (confidence as a formatted percentage), streamed per row group.
+        source = pq.ParquetFile(self.results_path)
+        with open(self.export_path, "w", encoding="utf-8", newline="") as f:
+            for i in range(source.num_row_groups):
+                chunk = source.read_row_group(i).to_pandas()
+                chunk["confidence"] = chunk["confidence"].map("{:.1f}%".format)
+                chunk.to_csv(f, index=False, header=i == 0)
+
+    def group_matches(self, labels, lo, hi):
+        # Matching row count per row group for the given filter.
+        source = pq.ParquetFile(self.results_path)
+        return [int(_match(source.read_row_group(i, columns=["prediction", "confidence"]), labels, lo, hi).sum())
+                for i in range(source.num_row_groups)]
+
+    def page(self, labels, lo, hi, counts, start, size) -> pd.DataFrame:
+        # Rows start..start+size of the filtered result; `counts` is group_matches().
+        source = pq.ParquetFile(self.results_path)
+        frames, skip, offset = [], start, 0
+        for i, n in enumerate(counts):
+            group_rows = source.metadata.row_group(i).num_rows
+            offset += group_rows
+            if skip >= n:
+                skip -= n
+                continue
+            chunk = source.read_row_group(i).to_pandas()
+            chunk.index += offset - group_rows
+            chunk = chunk[_match(chunk, labels, lo, hi)].iloc[skip:skip + size]
+            frames.append(chunk)
+            size -= len(chunk)
+            skip = 0
+            if size <= 0:
+                break
+        return pd.concat(frames) if frames else source.schema_arrow.empty_table().to_pandas()
+
+def _match(rows, labels, lo, hi) -> np.ndarray:
+    if isinstance(rows, pa.Table):
+        rows = rows.to_pandas()
+    mask = rows["confidence"].between(lo, hi).to_numpy()
+    if labels:
+        mask = mask & rows["prediction"].isin(labels).to_numpy()
+    return mask
@@ -0,0 +1,66 @@
+import os
+import time
+
+import numpy as np
+import torch
+
+from utils import MAX_LENGTH, eager_forward
+
+# ─── Settings ──────────────────────────────────────────────────────────────────
+# Opt in with MHA_PRECISION=bf16. The encoder then runs under bfloat16
+# autocast while the classifier head and softmax stay in fp32 (see
+# utils.eager_forward). At startup the host is checked for native bf16
+# support and both precisions are timed on a dummy batch; bf16 is only kept
+# if it is actually faster and agrees with fp32.
+REQUESTED = os.environ.get("MHA_PRECISION", "fp32").lower()
+BENCH_RUNS = 3
+BENCH_BATCH = 8
+MAX_PROB_DRIFT = 0.02
+
+def bf16_supported() -> bool:
+    # Without AVX512-BF16 / AMX, oneDNN emulates bf16 and is usually slower.
+    cpu = torch.cpu
+    native = any(
+        getattr(cpu, name, lambda: False)()
+        for name in ("_is_avx512_bf16_supported", "_is_amx_tile_supported")
+    )
+    return native and torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+
+def _bench(model, ids, mask):
+    best = float("inf")
+    with torch.no_grad():
+        for _ in range(BENCH_RUNS):
+            start = time.perf_counter()
+            logits, _ = eager_forward(model, ids, mask)
+            best = min(best, time.perf_counter() - start)
+    return best, torch.softmax(logits, dim=1).numpy()
+
+def configure_precision(model) -> dict:
+    info = {"requested": REQUESTED, "precision": "fp32", "speedup": None, "note": ""}
+    model.use_bf16 = False
+    model.precision_info = info
+    if REQUESTED != "bf16":
+        return info
+    if not bf16_supported():
+        info["note"] = "CPU has no native bf16 (AVX512-BF16 / AMX); using fp32"
+        return info
+
+    gen = torch.Generator().manual_seed(0)
+    ids = torch.randint(model.config.vocab_size, (BENCH_BATCH, MAX_LENGTH), generator=gen)
+    mask = torch.ones_like(ids)
+    fp32_time, fp32_probs = _bench(model, ids, mask)
+    model.use_bf16 = True
+    bf16_time, bf16_probs = _bench(model, ids, mask)
+
+    info["speedup"] = round(fp32_time / bf16_time, 2)
+    drift = float(np.abs(fp32_probs - bf16_probs).max())
+    if info["speedup"] <= 1.0:
+        model.use_bf16 = False
+        info["note"] = f"bf16 was not faster here ({info['speedup']}×); using fp32"
+    elif drift > MAX_PROB_DRIFT:
+        model.use_bf16 = False
+        info["note"] = f"bf16 probabilities drifted by {drift:.3f}; using fp32"
+    else:
+        info["precision"] = "bf16"
+        info["note"] = f"max probability drift vs fp32: {drift:.4f}"
+    return info
@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn.functional as F
+
+from utils import (
+    MODEL_PATH, PRUNING_FILE, BATCH_SIZE, label_map,
+    load_model, clean_and_lemmatize_series, tokenize_batch, iter_predict_proba, prune_bert_layer,
+)
+
+# Produces a slimmer copy of the fine-tuned model:
+#   1. scores attention heads and FFN neurons on a labelled calibration CSV
+#      (first-order Taylor importance, |activation · gradient| of the loss),
+#   2. drops the lowest-scoring heads globally and trims each layer's FFN,
+#   3. shrinks the word-embedding matrix to the token ids the corpus uses,
+#   4. writes a model directory that load_model() / MHA_MODEL_PATH can select,
+#      and reports size, latency and accuracy against the original.
+#
+#   python prune_model.py --calib data/calib.csv --eval data/holdout.csv --out model_pruned
+
+# Label names are matched case-insensitively ("Personality disorder" in the
+# statement/status dataset); numeric labels must be valid class ids.
+LABEL_IDS = {v.lower(): k for k, v in label_map.items()}
+
+# ─── Data ──────────────────────────────────────────────────────────────────────
+def text_column(df):
+    return next((c for c in df.columns if "text" in c.lower() or c.lower() == "statement"), None)
+
+def label_id(value):
+    # Class id for a label name or numeric id, or None if it is not one.
+    key = str(value).strip().lower()
+    if key in LABEL_IDS:
+        return LABEL_IDS[key]
+    try:
+        number = float(key)
+    except ValueError:
+        return None
+    return int(number) if number.is_integer() and int(number) in label_map else None
+
+def read_labelled_csv(path, limit=None, seed=0):
+    df = pd.read_csv(path)
+    text_col = text_column(df)
+    label_col = next((c for c in df.columns if c.lower() in ("label", "status")), None)
+    if text_col is None or label_col is None:
+        raise SystemExit(f"{path}: need a text/statement column and a label/status column")
+    df = df.dropna(subset=[text_col, label_col])
+    if limit and len(df) > limit:
+        df = df.sample(limit, random_state=seed)
+    labels = df[label_col].map(label_id)
+    unknown = df.loc[labels.isna(), label_col].astype(str).unique()
+    if len(unknown):
+        shown = ", ".join(repr(v) for v in sorted(unknown)[:10])
+        raise SystemExit(f"{path}: {len(unknown)} unrecognised label value(s): {shown}"
+                         f" (expected one of {', '.join(label_map.values())} or an id 0-{len(label_map) - 1})")
+    labels = labels.astype(int).to_numpy()
+    cleaned = clean_and_lemmatize_series(df[text_col].astype(str))
+    return cleaned, labels
+
+def encode(cleaned, tokenizer):
+    ids, mask = tokenize_batch(cleaned, tokenizer)
+    return torch.from_numpy(ids.astype(np.int64)), torch.from_numpy(mask.astype(np.int64))
+
+# ─── Importance ────────────────────────────────────────────────────────────────
+def score_importance(model, ids, mask, labels, batch_size=BATCH_SIZE):
+    layers = model.bert.encoder.layer
+    n_heads = model.config.num_attention_heads
+    head_size = model.config.hidden_size // n_heads
+    head_scores = torch.zeros(len(layers), n_heads)
+    neuron_scores = torch.zeros(len(layers), model.config.intermediate_size)
+
+    acts = {}
+    hooks = []
+    for i, layer in enumerate(layers):
+        hooks.append(layer.attention.self.register_forward_hook(
+            lambda mod, inp, out, i=i: acts.__setitem__(("attn", i), out[0] if isinstance(out, tuple) else out)))
+        hooks.append(layer.intermediate.register_forward_hook(
+            lambda mod, inp, out, i=i: acts.__setitem__(("ffn", i), out)))
+
+    try:
+        for start in range(0, len(ids), batch_size):
+            sl = slice(start, start + batch_size)
+            acts.clear()
+            with torch.enable_grad():
+                logits = model(input_ids=ids[sl], attention_mask=mask[sl]).logits
+                loss = F.cross_entropy(logits, torch.tensor(labels[sl]))
+                keys = list(acts)
+                grads = torch.autograd.grad(loss, [acts[k] for k in keys])
+            token_mask = mask[sl].unsqueeze(-1).float()
+            for (kind, i), grad in zip(keys, grads):
+                taylor = (acts[(kind, i)].detach() * grad) * token_mask   # (B, L, width)
+                if kind == "attn":
+                    per_head = taylor.view(*taylor.shape[:2], n_heads, head_size).sum(dim=(1, 3))
+                    head_scores[i] += per_head.abs().sum(dim=0)
+                else:
+                    neuron_scores[i] += taylor.sum(dim=1).abs().sum(dim=0)
+    finally:
+        for h in hooks:
+            h.remove()
+
+    # Per-layer normalisation makes head scores comparable across layers
+    head_scores /= head_scores.norm(dim=1, keepdim=True).clamp_min(1e-12)
+    return head_scores, neuron_scores
+
+def plan_pruning(head_scores, neuron_scores, head_ratio, ffn_ratio):
+    n_layers, n_heads = head_scores.shape
+    n_drop = int(head_ratio * n_layers * n_heads)
+    keep = [set(range(n_heads)) for _ in range(n_layers)]
+    for flat in torch.argsort(head_scores.flatten()).tolist():
+        if n_drop == 0:
+            break
+        layer, head = divmod(flat, n_heads)
+        if len(keep[layer]) > 1:  # never empty a layer
+            keep[layer].discard(head)
+            n_drop -= 1
+    keep_heads = [sorted(k) for k in keep]
+
+    width = neuron_scores.shape[1]
+    n_keep = max(1, int(round(width * (1 - ffn_ratio))))
+    keep_neurons = [sorted(torch.topk(s, n_keep).indices.tolist()) for s in neuron_scores]
+    return keep_heads, keep_neurons
+
+# ─── Vocabulary ────────────────────────────────────────────────────────────────
+def used_token_ids(tokenizer, texts):
+    ids, _ = tokenize_batch(texts, tokenizer)
+    used = set(np.unique(ids).tolist())
+    used.update(tokenizer.all_special_ids)
+    return sorted(used)  # ascending keeps [PAD] at id 0
+
+def shrink_embeddings(model, keep_ids):
+    old = model.bert.embeddings.word_embeddings
+    new = torch.nn.Embedding(len(keep_ids), old.embedding_dim, padding_idx=old.padding_idx)
+    new.weight.data = old.weight.data[torch.as_tensor(keep_ids)].clone()
+    model.bert.embeddings.word_embeddings = new
+    model.config.vocab_size = len(keep_ids)
+
+# ─── Reporting ─────────────────────────────────────────────────────────────────
+def param_megabytes(model):
+    return sum(p.numel() * p.element_size() for p in model.state_dict().values()) / 1e6
+
+def evaluate(model, tokenizer, cleaned, labels):
+    ids, mask = tokenize_batch(cleaned, tokenizer)
+    start = time.perf_counter()
+    probs = np.concatenate([p for _, p, _ in iter_predict_proba(ids, mask, model)])
+    elapsed = time.perf_counter() - start
+    accuracy = float((probs.argmax(axis=1) == labels).mean())
+    return accuracy, elapsed / max(len(cleaned), 1) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune attention heads, FFN width and vocabulary of the model.")
+    parser.add_argument("--calib", required=True, help="Labelled CSV used to score heads and neurons")
+    parser.add_argument("--eval", help="Labelled CSV for the accuracy report (defaults to --calib)")
+    parser.add_argument("--corpus", help="CSV whose texts define the kept vocabulary (defaults to --calib)")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(MODEL_PATH), "model_pruned"))
+    parser.add_argument("--heads", type=float, default=0.3, help="Fraction of attention heads to remove")
+    parser.add_argument("--ffn", type=float, default=0.3, help="Fraction of FFN neurons to remove per layer")
+    parser.add_argument("--samples", type=int, default=512, help="Calibration rows to score on")
+    args = parser.parse_args()
+
+    tokenizer, model = load_model(args.model)
+    calib_text, calib_labels = read_labelled_csv(args.calib, limit=args.samples)
+    eval_text, eval_labels = read_labelled_csv(args.eval) if args.eval else (calib_text, calib_labels)
+    if args.corpus:
+        corpus_df = pd.read_csv(args.corpus)
+        corpus = clean_and_lemmatize_series(corpus_df[text_column(corpus_df)].dropna().astype(str))
+    else:
+        corpus = calib_text + eval_text
+
+    base_size = param_megabytes(model)
+    base_acc, base_ms = evaluate(model, tokenizer, eval_text, eval_labels)
+
+    print(f"Scoring {len(calib_text)} calibration rows…")
+    head_scores, neuron_scores = score_importance(model, *encode(calib_text, tokenizer), calib_labels)
+    keep_heads, keep_neurons = plan_pruning(head_scores, neuron_scores, args.heads, args.ffn)
+    keep_ids = used_token_ids(tokenizer, corpus)
+
+    with torch.no_grad():
+        for layer, heads, neurons in zip(model.bert.encoder.layer, keep_heads, keep_neurons):
+            prune_bert_layer(layer, heads, neurons)
+        shrink_embeddings(model, keep_ids)
+
+    # Weights + config, then the per-layer structure and the reduced vocabulary
+    os.makedirs(args.out, exist_ok=True)
+    model.save_pretrained(args.out)
+    with open(os.path.join(args.out, PRUNING_FILE), "w") as f:
+        json.dump({
+            "source": os.path.abspath(args.model),
+            "heads": keep_heads,
+            "intermediate_size": [len(n) for n in keep_neurons],
+        }, f, indent=2)
+    for name in ("tokenizer_config.json", "special_tokens_map.json"):
+        src = os.path.join(args.model, name)
+        if os.path.exists(src):
+            shutil.copy(src, args.out)
+    vocab = tokenizer.convert_ids_to_tokens(keep_ids)
+    with open(os.path.join(args.out, "vocab.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab) + "\n")
+
+    # Reload through load_model() so the report reflects what the app will run
+    pruned_tokenizer, pruned = load_model(args.out)
+    acc, ms = evaluate(pruned, pruned_tokenizer, eval_text, eval_labels)
+    size = param_megabytes(pruned)
+    heads_left = sum(len(h) for h in keep_heads)
+
+    print(f"Saved pruned model to '{args.out}'")
+    print(f"  heads      : {heads_left}/{head_scores.numel()}")
+    print(f"  FFN width  : {len(keep_neurons[0])}/{neuron_scores.shape[1]} per layer")
+    print(f"  vocabulary : {len(keep_ids)}/{len(tokenizer)} tokens")
+    print(f"  size       : {base_size:.1f} MB → {size:.1f} MB ({size - base_size:+.1f} MB)")
+    print(f"  latency    : {base_ms:.1f} → {ms:.1f} ms/row ({(ms / base_ms - 1) * 100:+.1f}%)")
+    print(f"  accuracy   : {base_acc:.2%} → {acc:.2%} ({(acc - base_acc) * 100:+.2f} pts)")
+
+if __name__ == "__main__":
+    main()
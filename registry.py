@@ -0,0 +1,217 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from registry_paths import (
+    MODEL_PATH, REGISTRY_DIR, POINTER_FILE, version_dir, active_version, resolve,
+)
+
+# Local registry of model versions the app can switch between at runtime:
+#
+#   python registry.py add model --activate          # register a model directory
+#   python registry.py list
+#   python registry.py activate 20261019-120000-1a2b3c4d
+#
+# Running app processes notice the new pointer within MHA_REGISTRY_POLL_S
+# seconds, load the version in the background and switch over without a
+# restart. Setting MHA_MODEL_PATH pins a directory and bypasses the registry.
+# Path resolution lives in registry_paths.py.
+
+# ─── Layout ────────────────────────────────────────────────────────────────────
+# models/
+#     CURRENT                  ← name of the active version (replaced atomically)
+#     <version>/
+#         manifest.json        ← version, weights sha256, source, note, created
+#         config.json, vocab.txt, model.safetensors, [pruning.json], ...
+# A version is copied into a temp dir and renamed into place, and is never
+# modified afterwards. Processes map model.safetensors read-only (see
+# utils.load_model), so all workers serving a version share one copy.
+MANIFEST_FILE = "manifest.json"
+POLL_INTERVAL_S = float(os.environ.get("MHA_REGISTRY_POLL_S", "5"))
+VERSION_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+def read_manifest(version):
+    with open(os.path.join(version_dir(version), MANIFEST_FILE)) as f:
+        return json.load(f)
+
+def list_versions():
+    if not os.path.isdir(REGISTRY_DIR):
+        return []
+    manifests = [read_manifest(v) for v in os.listdir(REGISTRY_DIR)
+                 if os.path.exists(os.path.join(version_dir(v), MANIFEST_FILE))]
+    return sorted(manifests, key=lambda m: m["created"])
+
+def _sha256(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(chunk):
+            h.update(block)
+    return h.hexdigest()
+
+# ─── Writing ───────────────────────────────────────────────────────────────────
+def register(src, version=None, note=""):
+    weights = os.path.join(src, "model.safetensors")
+    if not os.path.exists(weights):
+        raise ValueError(f"{src}: no model.safetensors to register")
+    digest = _sha256(weights)
+    version = version or f"{datetime.now():%Y%m%d-%H%M%S}-{digest[:8]}"
+    if not VERSION_RE.match(version):
+        raise ValueError(f"Invalid version name: {version!r}")
+    if os.path.exists(version_dir(version)):
+        raise ValueError(f"Version {version} is already registered")
+
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f".{version}-", dir=REGISTRY_DIR)
+    try:
+        for name in os.listdir(src):
+            if os.path.isfile(os.path.join(src, name)) and name != MANIFEST_FILE:
+                shutil.copy2(os.path.join(src, name), tmp)
+        manifest = {
+            "version": version,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "source": os.path.abspath(src),
+            "sha256": digest,
+            "note": note,
+        }
+        with open(os.path.join(tmp, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+        # mkdtemp creates the directory 0700; open it up so workers running
+        # under another uid can map the weights. Files stay read-only.
+        for name in os.listdir(tmp):
+            os.chmod(os.path.join(tmp, name), 0o444)
+        os.chmod(tmp, 0o755)
+        os.rename(tmp, version_dir(version))
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return manifest
+
+def activate(version):
+    if not os.path.exists(os.path.join(version_dir(version), MANIFEST_FILE)):
+        raise ValueError(f"Unknown model version: {version}")
+    tmp = os.path.join(REGISTRY_DIR, POINTER_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(REGISTRY_DIR, POINTER_FILE))
+
+# ─── Serving ───────────────────────────────────────────────────────────────────
+class Deployment:
+    # One loaded version; `leases` counts the requests currently using it.
+    def __init__(self, version, path, tokenizer, model):
+        self.version = version
+        self.path = path
+        self.tokenizer = tokenizer
+        self.model = model
+        self.leases = 0
+
+class ModelPool:
+    # Serves the active version and follows the registry pointer. A newly
+    # activated version is loaded in a background thread while the current
+    # one keeps serving; new requests then lease the new version, and the old
+    # one is dropped as soon as its in-flight requests release it.
+    def __init__(self, loader):
+        self.loader = loader  # model directory -> (tokenizer, model)
+        self.lock = threading.Lock()
+        self.active = self._load(*resolve())
+        self.draining = []
+        self.loading = None
+        self.failed = self.error = None
+        self._checked = time.monotonic()
+
+    def _load(self, version, path):
+        return Deployment(version, path, *self.loader(path))
+
+    @contextmanager
+    def lease(self):
+        self.poll()
+        with self.lock:
+            dep = self.active
+            dep.leases += 1
+        try:
+            yield dep
+        finally:
+            with self.lock:
+                dep.leases -= 1
+                if not dep.leases and dep in self.draining:
+                    self.draining.remove(dep)
+
+    def poll(self):
+        now = time.monotonic()
+        if now - self._checked < POLL_INTERVAL_S:
+            return
+        self._checked = now
+        version, path = resolve()
+        with self.lock:
+            if self.loading or version in (self.active.version, self.failed):
+                return
+            self.loading = version
+        threading.Thread(target=self._swap, args=(version, path), name=f"load-model-{version}", daemon=True).start()
+
+    def _swap(self, version, path):
+        try:
+            dep = self._load(version, path)
+        except Exception as e:
+            with self.lock:
+                self.loading = None
+                self.failed = version  # not retried until the pointer moves again
+                self.error = f"{type(e).__name__}: {e}"
+            return
+        with self.lock:
+            old, self.active = self.active, dep
+            self.loading = self.failed = None
+            if old.leases:
+                self.draining.append(old)
+
+    def status(self):
+        with self.lock:
+            return {
+                "active": self.active.version,
+                "loading": self.loading,
+                "draining": [(d.version, d.leases) for d in self.draining],
+                "failed": (self.failed, self.error) if self.failed else None,
+            }
+
+# ─── CLI ───────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local model registry.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="Register a model directory as a new version")
+    add.add_argument("src", help="Directory with config.json, vocab and model.safetensors")
+    add.add_argument("--version", help="Version name (default: timestamp + weights hash)")
+    add.add_argument("--note", default="")
+    add.add_argument("--activate", action="store_true", help="Make it the active version")
+    act = sub.add_parser("activate", help="Switch running apps to a registered version")
+    act.add_argument("version")
+    sub.add_parser("list", help="Show registered versions")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "add":
+            manifest = register(args.src, args.version, args.note)
+            print(f"Registered {manifest['version']} (sha256 {manifest['sha256'][:12]})")
+            if args.activate:
+                activate(manifest["version"])
+                print(f"Activated {manifest['version']}")
+        elif args.command == "activate":
+            activate(args.version)
+            print(f"Activated {args.version}")
+        else:
+            current = active_version()
+            for m in list_versions():
+                mark = "*" if m["version"] == current else " "
+                print(f"{mark} {m['version']:<32} {m['created']}  {m['sha256'][:12]}  {m['note']}")
+            if current is None:
+                print(f"No active version; serving '{MODEL_PATH}'")
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+
+# Where the serving model lives, without importing utils (and with it torch,
+# transformers and the NLTK downloads), so Download_model.py stays cheap.
+# registry.py builds the CLI and hot swapping on top of these.
+project_dir = os.path.dirname(os.path.abspath(__file__))
+
+# MHA_MODEL_PATH selects another model directory, e.g. one written by prune_model.py
+MODEL_PATH = os.environ.get("MHA_MODEL_PATH", os.path.join(project_dir, "model"))
+REGISTRY_DIR = os.environ.get("MHA_REGISTRY_DIR", os.path.join(project_dir, "models"))
+POINTER_FILE = "CURRENT"
+LOCAL_VERSION = "local"  # the plain model/ directory, used while the registry is empty
+
+def version_dir(version):
+    return os.path.join(REGISTRY_DIR, version)
+
+def active_version():
+    try:
+        with open(os.path.join(REGISTRY_DIR, POINTER_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def resolve():
+    # (version, model directory) this process should be serving
+    if os.environ.get("MHA_MODEL_PATH"):
+        return os.path.basename(os.path.normpath(MODEL_PATH)), MODEL_PATH
+    version = active_version()
+    if version is None:
+        return LOCAL_VERSION, MODEL_PATH
+    return version, version_dir(version)
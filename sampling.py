@@ -0,0 +1,46 @@
+import numpy as np
+
+# ─── Quick Estimate ────────────────────────────────────────────────────────────
+# Rows are stratified by text-length quantiles (length correlates with label,
+# so this tightens the intervals at no cost) and sampled with proportional
+# allocation. Label shares are then the stratum-weighted sample shares, with
+# normal-approximation intervals from the stratified variance including the
+# finite-population correction.
+Z_95 = 1.96
+N_STRATA = 5
+
+def sample_size(margin, population, z=Z_95):
+    # Worst case p = 0.5, corrected for a finite population
+    n0 = (z ** 2) * 0.25 / margin ** 2
+    return int(min(population, np.ceil(n0 / (1 + (n0 - 1) / population))))
+
+def length_strata(lengths, n_strata=N_STRATA):
+    lengths = np.asarray(lengths)
+    edges = np.unique(np.quantile(lengths, np.linspace(0, 1, n_strata + 1)[1:-1]))
+    return np.digitize(lengths, edges)
+
+def stratified_sample(strata, n, seed=0):
+    rng = np.random.default_rng(seed)
+    total = len(strata)
+    picked = []
+    for h in np.unique(strata):
+        members = np.flatnonzero(strata == h)
+        n_h = min(len(members), max(2, int(round(n * len(members) / total))))
+        picked.append(rng.choice(members, n_h, replace=False))
+    return np.sort(np.concatenate(picked))
+
+def estimate_proportions(pred_ids, sample_strata, strata, n_classes, z=Z_95):
+    # Returns (estimate, lower, upper) arrays of length n_classes.
+    total = len(strata)
+    est = np.zeros(n_classes)
+    var = np.zeros(n_classes)
+    for h in np.unique(sample_strata):
+        in_h = sample_strata == h
+        n_h, N_h = int(in_h.sum()), int((strata == h).sum())
+        p_h = np.bincount(pred_ids[in_h], minlength=n_classes) / n_h
+        w_h = N_h / total
+        est += w_h * p_h
+        if n_h > 1:
+            var += w_h ** 2 * (1 - n_h / N_h) * p_h * (1 - p_h) / (n_h - 1)
+    half = z * np.sqrt(var)
+    return est, np.clip(est - half, 0, 1), np.clip(est + half, 0, 1)
@@ -0,0 +1,244 @@
+import collections
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from utils import BATCH_SIZE, DEVICE, forward
+
+# ─── Settings ──────────────────────────────────────────────────────────────────
+# One worker thread runs every forward pass. Interactive work (Analyze
+# predictions) always goes first. Explanations come next, then bulk jobs.
+# Both are cut into slices sized from their measured cost so one slice takes
+# about half the target latency, which bounds how long an Analyze request can
+# wait behind slower work. Bulk slices also run with only a share
+# of the intra-op threads, leaving the remaining cores free.
+TARGET_LATENCY_S = float(os.environ.get("MHA_TARGET_LATENCY_MS", "500")) / 1000
+BULK_CPU_SHARE = float(os.environ.get("MHA_BULK_CPU_SHARE", "0.5"))
+MAX_SLICE_ROWS = 4 * BATCH_SIZE
+LATENCY_WINDOW = 200
+
+class BulkJob:
+    # Iterate for (start_row, probs, pooled) in row order; leaving the
+    # `with` block (or a rerun interrupting it) cancels the remaining slices.
+    # With `rows`, only those rows are scored and start_row indexes into it.
+    _DONE = object()
+
+    def __init__(self, scheduler, model, input_ids, attention_mask, rows=None):
+        self.scheduler = scheduler
+        self.model = model
+        self.input_ids = input_ids
+        self.attention_mask = attention_mask
+        self.rows = rows
+        self.total = len(input_ids) if rows is None else len(rows)
+        self.pos = 0
+        self.cancelled = False
+        self.results = collections.deque()
+        self.ready = threading.Condition()
+
+    def _put(self, item):
+        with self.ready:
+            self.results.append(item)
+            self.ready.notify()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cancel()
+
+    def __iter__(self):
+        try:
+            while True:
+                with self.ready:
+                    while not self.results:
+                        self.ready.wait()
+                    item = self.results.popleft()
+                if item is BulkJob._DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.cancel()
+
+class SlicedJob:
+    # A generator driven by the worker: send(n) runs up to n steps and yields
+    # how many ran; its return value is the job's result. Each job measures
+    # its own per-step cost, since that depends on the input (e.g. text length).
+    def __init__(self, gen):
+        self.gen = gen
+        self.future = Future()
+        self.submitted = time.perf_counter()
+        self.started = False
+        self.sec_per_step = None
+
+    def next_steps(self):
+        if self.sec_per_step is None:
+            return 1  # first slice measures the cost
+        return max(1, int(TARGET_LATENCY_S / 2 / self.sec_per_step))
+
+class InferenceScheduler:
+    # Model-agnostic: each job carries the model it runs, so jobs for an old
+    # and a newly activated registry version can share the worker.
+    def __init__(self):
+        self.total_threads = torch.get_num_threads()
+        self.bulk_threads = max(1, int(self.total_threads * BULK_CPU_SHARE))
+        self.interactive = collections.deque()
+        self.sliced = collections.deque()
+        self.bulk = collections.deque()
+        self.cond = threading.Condition()
+        self.sec_per_row = None  # EMA of bulk cost, drives slice size
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.sliced_latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.slice_seconds = collections.deque(maxlen=LATENCY_WINDOW)  # explanation and bulk slices: what Analyze waits behind
+        self.bulk_rows = 0
+        self.bulk_seconds = 0.0
+        self._threads = None
+        threading.Thread(target=self._run, name="inference-scheduler", daemon=True).start()
+
+    # ── Submission ──
+    def run_interactive(self, fn, *args, **kwargs):
+        future = Future()
+        with self.cond:
+            self.interactive.append((fn, args, kwargs, future, time.perf_counter()))
+            self.cond.notify()
+        return future.result()
+
+    def run_sliced(self, gen):
+        # Runs a SlicedJob generator one slice per turn, after interactive
+        # work and before bulk slices; returns the generator's return value.
+        job = SlicedJob(gen)
+        with self.cond:
+            self.sliced.append(job)
+            self.cond.notify()
+        return job.future.result()
+
+    def submit_bulk(self, model, input_ids, attention_mask, rows=None):
+        job = BulkJob(self, model, input_ids, attention_mask, rows)
+        if not job.total:
+            job._put(BulkJob._DONE)
+            return job
+        with self.cond:
+            self.bulk.append(job)
+            self.cond.notify()
+        return job
+
+    # ── Worker ──
+    def _set_threads(self, n):
+        if n != self._threads:
+            torch.set_num_threads(n)
+            self._threads = n
+
+    def _slice_rows(self):
+        if self.sec_per_row is None:
+            return 1  # first slice measures the cost
+        rows = int(TARGET_LATENCY_S / 2 / self.sec_per_row)
+        return max(1, min(rows, MAX_SLICE_ROWS))
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.interactive and not self.sliced and not self.bulk:
+                    self.cond.wait()
+                task = sliced = job = None
+                if self.interactive:
+                    task = self.interactive.popleft()
+                elif self.sliced:
+                    sliced = self.sliced.popleft()
+                else:
+                    job = self.bulk.popleft()
+            if task is not None:
+                self._run_interactive(*task)
+            elif sliced is not None:
+                if self._run_sliced(sliced):
+                    with self.cond:
+                        self.sliced.append(sliced)  # round-robin between explanations
+            elif not job.cancelled:
+                self._run_slice(job)
+                if job.pos < job.total and not job.cancelled:
+                    with self.cond:
+                        self.bulk.append(job)  # round-robin between bulk jobs
+
+    def _run_interactive(self, fn, args, kwargs, future, submitted):
+        self._set_threads(self.total_threads)
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        self.latencies.append(time.perf_counter() - submitted)
+
+    def _run_sliced(self, job):
+        # Returns True while the job has more slices to run.
+        self._set_threads(self.total_threads)
+        t0 = time.perf_counter()
+        try:
+            if not job.started:
+                job.gen.send(None)  # setup, up to the first yield
+                job.started = True
+            steps = job.next_steps()
+            ran = job.gen.send(steps)
+        except StopIteration as done:
+            job.future.set_result(done.value)
+        except BaseException as e:
+            job.future.set_exception(e)
+        else:
+            elapsed = time.perf_counter() - t0
+            self.slice_seconds.append(elapsed)
+            per_step = elapsed / max(ran, 1)
+            job.sec_per_step = per_step if job.sec_per_step is None else 0.8 * job.sec_per_step + 0.2 * per_step
+            return True
+        self.slice_seconds.append(time.perf_counter() - t0)
+        self.sliced_latencies.append(time.perf_counter() - job.submitted)
+        return False
+
+    def _run_slice(self, job):
+        self._set_threads(self.bulk_threads)
+        start = job.pos
+        end = min(start + self._slice_rows(), job.total)
+        t0 = time.perf_counter()
+        sl = slice(start, end) if job.rows is None else job.rows[start:end]
+        try:
+            ids = torch.from_numpy(np.asarray(job.input_ids[sl], dtype=np.int64)).to(DEVICE)
+            mask = torch.from_numpy(np.asarray(job.attention_mask[sl], dtype=np.int64)).to(DEVICE)
+            with torch.no_grad():
+                logits, pooled = forward(job.model, ids, mask)
+            job._put((start, F.softmax(logits, dim=1).cpu().numpy(), pooled.cpu().numpy()))
+        except BaseException as e:
+            job.pos = job.total
+            job._put(e)
+            return
+        elapsed = time.perf_counter() - t0
+        self.slice_seconds.append(elapsed)
+        per_row = elapsed / (end - start)
+        self.sec_per_row = per_row if self.sec_per_row is None else 0.8 * self.sec_per_row + 0.2 * per_row
+        self.bulk_rows += end - start
+        self.bulk_seconds += elapsed
+        job.pos = end
+        if end == job.total:
+            job._put(BulkJob._DONE)
+
+    # ── Diagnostics ──
+    def stats(self):
+        lat = np.array(self.latencies) * 1000
+        sliced_lat = np.array(self.sliced_latencies) * 1000
+        slices = np.array(self.slice_seconds) * 1000
+        return {
+            "interactive_p50_ms": float(np.percentile(lat, 50)) if len(lat) else None,
+            "interactive_p95_ms": float(np.percentile(lat, 95)) if len(lat) else None,
+            "sliced_p50_ms": float(np.percentile(sliced_lat, 50)) if len(sliced_lat) else None,
+            "slice_p95_ms": float(np.percentile(slices, 95)) if len(slices) else None,
+            "target_ms": TARGET_LATENCY_S * 1000,
+            "queued_interactive": len(self.interactive),
+            "queued_sliced": len(self.sliced),
+            "bulk_jobs": len(self.bulk),
+            "bulk_rows_per_s": self.bulk_rows / self.bulk_seconds if self.bulk_seconds else None,
+            "threads": (self.total_threads, self.bulk_threads),
+        }
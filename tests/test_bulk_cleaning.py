@@ -0,0 +1,46 @@
+import html
+import os
+import random
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import clean_and_lemmatize_series, clean_and_lemmatize_text, fix_encoding, normalize_series, normalize_text
+
+# Differential check: the bulk path must match the scalar path row for row.
+PIECES = [
+    "I", "feel", "so", "tired", "today", "and", "can't", "sleep", "anymore", "RT", "rt", "RTs",
+    "@friend", "@", "@_x1", "#sad", "#", "##help", "http://a.b/c?d=1", "https://x.io", "www.site.org/p",
+    "httpfoo", "&amp;", "&lt;3", "&#39;", "&quot;hi&quot;", "&nbsp;", "&bogus;", "Ã©", "â€™", "Ã",
+    "café", "naïve", " ", "\x85", "’", "😢", "всё", "你好",
+    "\v", "\x1c", "\x1d", "\x1e", "\x1f", "\t", "\n", "\r\n", "\f", " ", "  ", ".", ",", "!", "?", "'",
+    "...", "-", "_", "$", "0", "42", "don't", "I'm",
+]
+
+def fuzz_rows(n, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        k = rng.randint(0, 12)
+        sep = rng.choice(["", " ", "  ", "\v", "\x1f", "\xa0"])
+        rows.append(sep.join(rng.choice(PIECES) for _ in range(k)))
+    return rows + ["", "   ", "\v\x1c\x1d\x1e\x1f", "\x85\xa0", "RT @a #b http://c", None, 3.0]
+
+def test_normalize_series_matches_scalar_on_fuzzed_rows():
+    # The regex stage alone; needs no NLTK corpora.
+    rows = fuzz_rows(5000, seed=2)
+    expected = [normalize_text(fix_encoding(html.unescape(r))) if isinstance(r, str) and r.strip() else ""
+                for r in rows]
+    assert normalize_series(pd.Series(rows, dtype=object)).tolist() == expected
+
+def test_series_matches_scalar_on_fuzzed_rows():
+    rows = fuzz_rows(2000)
+    expected = [clean_and_lemmatize_text(r) for r in rows]
+    assert clean_and_lemmatize_series(pd.Series(rows, dtype=object)) == expected
+
+def test_series_keeps_non_default_index():
+    rows = fuzz_rows(200, seed=1)
+    series = pd.Series(rows, index=range(1000, 1000 + len(rows)), dtype=object)
+    assert clean_and_lemmatize_series(series) == [clean_and_lemmatize_text(r) for r in rows]
@@ -1,13 +1,21 @@
+import numpy as np
+import pandas as pd
 import torch
-from transformers import BertTokenizer, BertForSequenceClassification
+import torch.nn.functional as F
+from transformers import BertConfig, BertTokenizer, BertForSequenceClassification
+from transformers.pytorch_utils import prune_linear_layer
+from safetensors.torch import load_file as load_safetensors
 import html
 import re
 from nltk.stem import WordNetLemmatizer
-from nltk import pos_tag, word_tokenize
+from nltk import pos_tag, pos_tag_sents, word_tokenize
 from nltk.corpus import wordnet
 import nltk
+import json
 import os
 
+from registry_paths import MODEL_PATH
+
 # ─── NLTK Setup ────────────────────────────────────────────────────────────────
 project_dir = os.path.dirname(os.path.abspath(__file__))
 nltk_data_path = os.path.join(project_dir, "nltk_data")
@@ -30,20 +38,31 @@ def get_wordnet_pos(treebank_tag):
     return wordnet.NOUN
 
 # ─── Text Cleaning ─────────────────────────────────────────────────────────────
+RT_RE         = re.compile(r"\bRT\b")
+MENTION_RE    = re.compile(r"@\w+")
+URL_RE        = re.compile(r"http\S+|www\S+")
+HASHTAG_RE    = re.compile(r"#(\w+)")
+DISALLOWED_RE = re.compile(r"[^a-zA-Z0-9\s.,!?']")
+SPACE_RE      = re.compile(r"\s+")
+
+def fix_encoding(text):
+    try:
+        return text.encode('latin1', errors='ignore').decode('utf-8', errors='ignore')
+    except Exception:
+        return text
+
+def normalize_text(text):
+    text = RT_RE.sub("", text)
+    text = MENTION_RE.sub("", text)
+    text = URL_RE.sub("", text)
+    text = HASHTAG_RE.sub(r"\1", text)
+    text = DISALLOWED_RE.sub(" ", text)
+    return SPACE_RE.sub(" ", text).strip()
+
 def clean_and_lemmatize_text(text):
     if not isinstance(text, str) or not text.strip():
         return ""
-    text = html.unescape(text)
-    try:
-        text = text.encode('latin1', errors='ignore').decode('utf-8', errors='ignore')
-    except Exception:
-        pass
-    text = re.sub(r"\bRT\b", "", text)
-    text = re.sub(r"@\w+", "", text)
-    text = re.sub(r"http\S+|www\S+", "", text)
-    text = re.sub(r"#(\w+)", r"\1", text)
-    text = re.sub(r"[^a-zA-Z0-9\s.,!?']", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
+    text = normalize_text(fix_encoding(html.unescape(text)))
     if not text:
         return ""
     tokens = word_tokenize(text)
@@ -51,6 +70,68 @@ def clean_and_lemmatize_text(text):
     lemmatized = [lemmatizer.lemmatize(t, get_wordnet_pos(p)) for t, p in pos_tags]
     return " ".join(lemmatized)
 
+# ─── Bulk Text Cleaning ────────────────────────────────────────────────────────
+# Series-level equivalent of clean_and_lemmatize_text (same output, row for
+# row). html.unescape and the latin1/utf-8 round trip only touch rows that
+# contain "&" or non-ASCII characters. Rows that are ASCII afterwards (nearly
+# all of them) run the regex passes as Arrow string kernels; the patterns
+# spell out Python's ASCII \s (which includes \v and \x1c-\x1f) so RE2 and
+# `re` agree on them. Rows still holding non-ASCII text use the compiled
+# patterns above, since the engines disagree on Unicode \w and \s.
+_WS_CTRL = r"\t\n\v\f\r\x1c-\x1f"
+_WS = _WS_CTRL + " "
+BULK_PASSES = (
+    (r"\bRT\b", ""),
+    (r"@\w+", ""),
+    (rf"http[^{_WS}]+|www[^{_WS}]+", ""),
+    (r"#(\w+)", r"\1"),
+    (rf"[^a-zA-Z0-9{_WS}.,!?']", " "),
+    (rf"[{_WS}]{{2,}}|[{_WS_CTRL}]", " "),  # lone spaces are already final
+)
+NON_ASCII = r"[^\x00-\x7f]"
+CLEAN_CHUNK = 4096
+
+def normalize_series(texts: pd.Series) -> pd.Series:
+    is_str = texts.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    s = pd.Series(np.where(is_str, texts.to_numpy(dtype=object), ""),
+                  index=texts.index, dtype=pd.StringDtype("pyarrow"))
+    amp = s.str.contains("&", regex=False).to_numpy(dtype=bool)
+    if amp.any():
+        s[amp] = s[amp].map(html.unescape)
+    wide = s.str.contains(NON_ASCII).to_numpy(dtype=bool)
+    if wide.any():
+        s[wide] = s[wide].map(fix_encoding)
+        wide = s.str.contains(NON_ASCII).to_numpy(dtype=bool)
+
+    ascii_rows = s[~wide]
+    for pattern, repl in BULK_PASSES:
+        ascii_rows = ascii_rows.str.replace(pattern, repl, regex=True)
+    s[~wide] = ascii_rows.str.strip(" ")
+    if wide.any():
+        s[wide] = s[wide].map(normalize_text)
+    return s
+
+def clean_and_lemmatize_series(texts: pd.Series) -> list:
+    normalized = normalize_series(texts).tolist()
+    rows = [i for i, t in enumerate(normalized) if t]
+    tagged = pos_tag_sents([word_tokenize(normalized[i]) for i in rows])
+    lemmas = {}
+    cleaned = [""] * len(normalized)
+    for i, pos_tags in zip(rows, tagged):
+        words = []
+        for t, p in pos_tags:
+            key = (t, get_wordnet_pos(p))
+            if key not in lemmas:
+                lemmas[key] = lemmatizer.lemmatize(*key)
+            words.append(lemmas[key])
+        cleaned[i] = " ".join(words)
+    return cleaned
+
+def iter_clean_texts(texts: pd.Series, chunk_size=CLEAN_CHUNK):
+    # Yields (start_row, cleaned) per chunk so callers can report progress.
+    for start in range(0, len(texts), chunk_size):
+        yield start, clean_and_lemmatize_series(texts.iloc[start:start + chunk_size])
+
 # ─── Text Stats ────────────────────────────────────────────────────────────────
 def get_text_stats(text: str) -> dict:
     words = text.split()
@@ -70,18 +151,112 @@ def get_text_stats(text: str) -> dict:
     }
 
 # ─── Model ─────────────────────────────────────────────────────────────────────
-MODEL_PATH = os.path.join(project_dir, "model")
+PRUNING_FILE = "pruning.json"
 DEVICE = "cpu"  # Streamlit Cloud has no GPU; CPU is the default
+MAX_LENGTH = 128
+BATCH_SIZE = 32
 
-def load_model():
-    tokenizer = BertTokenizer.from_pretrained(MODEL_PATH)
-    model = BertForSequenceClassification.from_pretrained(
-        MODEL_PATH,
-        dtype=torch.float32,
-    )
+def load_model(model_path=MODEL_PATH):
+    # Parameters are assigned straight from the memory-mapped safetensors file
+    # instead of being copied, so every process serving the same file shares
+    # one read-only copy of the weights in the page cache. The module is built
+    # on the meta device, so no throwaway random weights are allocated first.
+    tokenizer = BertTokenizer.from_pretrained(model_path)
+    config = BertConfig.from_pretrained(model_path)
+    with torch.device("meta"):
+        model = BertForSequenceClassification(config)
+    pruning_file = os.path.join(model_path, PRUNING_FILE)
+    if os.path.exists(pruning_file):
+        apply_pruning(model, pruning_file)
+    state = load_safetensors(os.path.join(model_path, "model.safetensors"))
+    state = {k: v.float() if v.is_floating_point() and v.dtype != torch.float32 else v for k, v in state.items()}
+    missing, _ = model.load_state_dict(state, strict=False, assign=True)
+    if missing:
+        raise RuntimeError(f"{model_path}: checkpoint is missing {len(missing)} weights, e.g. {missing[0]}")
+    # Non-persistent buffers are not in the checkpoint; rebuild them for real.
+    embeddings = model.bert.embeddings
+    embeddings.position_ids = torch.arange(config.max_position_embeddings).expand((1, -1))
+    if hasattr(embeddings, "token_type_ids"):
+        embeddings.token_type_ids = torch.zeros_like(embeddings.position_ids)
+    still_meta = [name for name, t in [*model.named_parameters(), *model.named_buffers()] if t.is_meta]
+    if still_meta:
+        raise RuntimeError(f"{model_path}: {len(still_meta)} tensors were never loaded, e.g. {still_meta[0]}")
     model.eval()
     return tokenizer, model
 
+# ─── Pruned Models ─────────────────────────────────────────────────────────────
+# Pruned checkpoints have per-layer head counts and FFN widths that a plain
+# BertConfig cannot describe, so load_model() rebuilds the structure from
+# pruning.json before the weights are assigned.
+def prune_bert_layer(layer, keep_heads, keep_neurons):
+    attn = layer.attention.self
+    head_size = attn.attention_head_size
+    idx = torch.cat([torch.arange(h * head_size, (h + 1) * head_size) for h in keep_heads])
+    attn.query = prune_linear_layer(attn.query, idx)
+    attn.key = prune_linear_layer(attn.key, idx)
+    attn.value = prune_linear_layer(attn.value, idx)
+    layer.attention.output.dense = prune_linear_layer(layer.attention.output.dense, idx, dim=1)
+    attn.num_attention_heads = len(keep_heads)
+    attn.all_head_size = len(keep_heads) * head_size
+
+    neurons = torch.as_tensor(keep_neurons, dtype=torch.long)
+    layer.intermediate.dense = prune_linear_layer(layer.intermediate.dense, neurons)
+    layer.output.dense = prune_linear_layer(layer.output.dense, neurons, dim=1)
+
+def apply_pruning(model, pruning_file):
+    with open(pruning_file) as f:
+        spec = json.load(f)
+    for i, layer in enumerate(model.bert.encoder.layer):
+        prune_bert_layer(layer, range(len(spec["heads"][i])), range(spec["intermediate_size"][i]))
+
+def eager_forward(model, input_ids, attention_mask):
+    # Same computation as model(...) but also hands back the pooled [CLS]
+    # vector the classifier head sees, for the embedding store. With
+    # precision.py's bf16 mode only the encoder runs under autocast.
+    with torch.autocast("cpu", dtype=torch.bfloat16, enabled=getattr(model, "use_bf16", False)):
+        pooled = model.bert(input_ids=input_ids, attention_mask=attention_mask).pooler_output
+    pooled = pooled.float()
+    logits = model.classifier(model.dropout(pooled))
+    return logits, pooled
+
+def forward(model, input_ids, attention_mask):
+    # Uses the warmed shape-specialised graphs when compiled.py has attached them.
+    compiled = getattr(model, "compiled_forward", None)
+    if compiled is not None:
+        return compiled(input_ids, attention_mask)
+    return eager_forward(model, input_ids, attention_mask)
+
+def predict_with_embedding(text, tokenizer, model):
+    cleaned = clean_and_lemmatize_text(text)
+    inputs = tokenizer(cleaned, padding="max_length", truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
+    with torch.no_grad():
+        logits, pooled = forward(model, inputs["input_ids"].to(DEVICE), inputs["attention_mask"].to(DEVICE))
+    return F.softmax(logits, dim=1).cpu().numpy()[0], pooled.cpu().numpy()[0]
+
+# ─── Batched Inference ─────────────────────────────────────────────────────────
+def tokenize_batch(cleaned_texts, tokenizer, chunk_size=4096):
+    n = len(cleaned_texts)
+    input_ids = np.zeros((n, MAX_LENGTH), dtype=np.int32)
+    attention_mask = np.zeros((n, MAX_LENGTH), dtype=np.int8)
+    for start in range(0, n, chunk_size):
+        enc = tokenizer(
+            list(cleaned_texts[start:start + chunk_size]),
+            padding="max_length", truncation=True, max_length=MAX_LENGTH,
+            return_tensors="np",
+        )
+        input_ids[start:start + chunk_size] = enc["input_ids"]
+        attention_mask[start:start + chunk_size] = enc["attention_mask"]
+    return input_ids, attention_mask
+
+def iter_predict_proba(input_ids, attention_mask, model, batch_size=BATCH_SIZE):
+    # Yields (start_row, probs, pooled) per batch so callers can report progress.
+    for start in range(0, len(input_ids), batch_size):
+        ids = torch.from_numpy(np.asarray(input_ids[start:start + batch_size], dtype=np.int64))
+        mask = torch.from_numpy(np.asarray(attention_mask[start:start + batch_size], dtype=np.int64))
+        with torch.no_grad():
+            logits, pooled = forward(model, ids.to(DEVICE), mask.to(DEVICE))
+        yield start, F.softmax(logits, dim=1).cpu().numpy(), pooled.cpu().numpy()
+
 # ─── Labels ────────────────────────────────────────────────────────────────────
 label_map = {
     0: "Anxiety",